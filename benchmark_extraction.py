@@ -0,0 +1,156 @@
+"""Microbenchmark for the rule-based extraction in main1.py
+
+Reports messages/second for the previous approach (every pattern, uncompiled,
+on every message) against the trigger-gated precompiled rules, and for the
+full process_member_data pass. With --sizes, also compares serial
+process_member_data against the sharded process pool across dataset sizes.
+
+    python benchmark_extraction.py
+    python benchmark_extraction.py --messages 20000 --input messages.json
+    python benchmark_extraction.py --sizes 10000,100000,500000 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+import main1
+from main1 import EXTRACTION_RULES, RESTAURANT_NAME_NOISE, MemberDataAnalyzer
+
+NAMES = ["Sophia Al-Farsi", "Fatima El-Tahir", "Armand Dupont", "Hans Müller", "Layla Kawaguchi",
+         "Amina Van Den Berg", "Vikram Desai", "Lily O'Sullivan", "Lorenzo Cavalli", "Thiago Monteiro"]
+TEMPLATES = [
+    "Please book a table for {n} at Nobu on Friday.",
+    "I need a trip to Paris next month.",
+    "Book a villa in Santorini for the weekend.",
+    "I prefer aisle seats on flights.",
+    "Can you get tickets to the opera in Milan?",
+    "Reserve dinner at The Ivy for {n} people.",
+    "Arrange a private car to the airport.",
+    "Update my phone number to 555-0101.",
+    "I'd like two seats for the Lakers game.",
+    "Please ensure vegan meals next time.",
+    "Thanks for the quick confirmation, everything was perfect.",
+    "Could you arrange a tour of the Louvre for {n} guests?",
+]
+
+def synthetic_items(count: int, seed: int = 1, members: int = len(NAMES)) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    names = NAMES if members <= len(NAMES) else [f"Member {index}" for index in range(members)]
+    return [
+        {
+            "user_name": rng.choice(names),
+            "message": rng.choice(TEMPLATES).format(n=rng.randint(2, 8)),
+            "timestamp": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00"
+        }
+        for _ in range(count)
+    ]
+
+def extract_all_rules(message: str) -> List[Any]:
+    """Previous approach: every pattern runs on every message, compiled on each call"""
+    matches = []
+    for category, _, pattern in EXTRACTION_RULES:
+        for match in re.findall(pattern.pattern, message, re.IGNORECASE):
+            if category == "restaurant":
+                match = re.sub(RESTAURANT_NAME_NOISE.pattern, '', match.strip(), flags=re.IGNORECASE).strip()
+            matches.append((category, match))
+    return matches
+
+def extract_gated(message: str) -> List[Any]:
+    """Trigger-gated precompiled rules, as in MemberDataAnalyzer.extract_info_from_message"""
+    message_lower = message.lower()
+    matches = []
+    for category, trigger, pattern in EXTRACTION_RULES:
+        if trigger not in message_lower:
+            continue
+        for match in pattern.findall(message):
+            if category == "restaurant":
+                match = RESTAURANT_NAME_NOISE.sub('', match.strip()).strip()
+            matches.append((category, match))
+    return matches
+
+def messages_per_second(run: Callable[[], Any], message_count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return message_count / best
+
+def record_snapshot(records: Dict[str, Any]) -> List[Any]:
+    """Comparable view of process_member_data output"""
+    return [
+        (name, record.messages, record.requests, record.travel,
+         list(record.locations), list(record.restaurants), list(record.preferences), list(record.activities))
+        for name, record in records.items()
+    ]
+
+def compare_parallel(sizes: List[int], workers: int, repeat: int):
+    """Serial process_member_data against the sharded process pool"""
+    main1.EXTRACTION_WORKERS = workers
+    main1.EXTRACTION_PARALLEL_MIN_ITEMS = 0
+    analyzer = MemberDataAnalyzer()
+
+    async def run_pool(payload):
+        return await analyzer.process_member_data_async(payload)
+
+    try:
+        # Start the workers before timing anything
+        asyncio.run(run_pool({"items": synthetic_items(workers * 10)}))
+
+        print(f"\nprocess_member_data, serial vs {workers} worker processes (best of {repeat})")
+        for size in sizes:
+            payload = {"items": synthetic_items(size, members=200)}
+            if record_snapshot(analyzer.process_member_data(payload)) != record_snapshot(asyncio.run(run_pool(payload))):
+                raise SystemExit(f"Parallel extraction differs from serial at {size} messages")
+            serial = messages_per_second(lambda: analyzer.process_member_data(payload), size, repeat)
+            parallel = messages_per_second(lambda: asyncio.run(run_pool(payload)), size, repeat)
+            print(f"  {size:>9,} messages  serial {serial:>10,.0f}/s  parallel {parallel:>10,.0f}/s  ({parallel / serial:.2f}x)")
+    finally:
+        main1.shutdown_extraction_pool()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000, help="synthetic messages to generate")
+    parser.add_argument("--input", help="saved /messages payload to use instead of synthetic data")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the best is reported")
+    parser.add_argument("--sizes", help="comma-separated dataset sizes for the serial vs process pool comparison")
+    parser.add_argument("--workers", type=int, default=main1.EXTRACTION_WORKERS, help="worker processes for --sizes")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            payload = json.load(f)
+        items = payload["items"] if isinstance(payload, dict) else payload
+    else:
+        items = synthetic_items(args.messages)
+    messages = [item["message"] for item in items if isinstance(item, dict) and "message" in item]
+
+    # Gating must never change what is extracted
+    mismatches = sum(1 for message in messages if extract_all_rules(message) != extract_gated(message))
+    if mismatches:
+        raise SystemExit(f"{mismatches} messages extract differently with gating")
+
+    analyzer = MemberDataAnalyzer()
+    results = [
+        ("all patterns, uncompiled (before)",
+         messages_per_second(lambda: [extract_all_rules(m) for m in messages], len(messages), args.repeat)),
+        ("gated, precompiled (after)",
+         messages_per_second(lambda: [extract_gated(m) for m in messages], len(messages), args.repeat)),
+        ("process_member_data, end to end",
+         messages_per_second(lambda: analyzer.process_member_data({"items": items}), len(messages), args.repeat)),
+    ]
+
+    print(f"{len(messages)} messages, best of {args.repeat} runs")
+    for label, rate in results:
+        print(f"  {label:<36} {rate:>12,.0f} messages/s")
+    print(f"  speedup (extraction only)            {results[1][1] / results[0][1]:>11.1f}x")
+
+    if args.sizes:
+        compare_parallel([int(size) for size in args.sizes.split(",")], args.workers, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,46 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
 import httpx
+import asyncio
+import bisect
+import codecs
+import hashlib
+import heapq
 import json
+import math
 import os
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+import random
+import re
+import time
+import zlib
+import numpy as np
+from typing import AsyncIterator, Collection, Dict, List, Any, Literal, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+from main1 import QUESTION_TOPICS, MemberDataAnalyzer, MemberNameIndex, shutdown_extraction_pool
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared HTTP client pools on startup and close them on shutdown"""
+    ai_qa.open_clients()
+    try:
+        yield
+    finally:
+        ai_qa.cancel_refresh()
+        await ai_qa.close_clients()
+        shutdown_extraction_pool()
+
 app = FastAPI(
     title="AI-Powered Member Data Q&A System",
     description="An intelligent question-answering system for member data using AI",
-    version="2.0.1"
+    version="2.0.1",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -27,147 +55,1942 @@ app.add_middleware(
 # Data models
 class QuestionRequest(BaseModel):
     question: str
+    # "auto" tries the local rule-based path first, "local" never calls the AI,
+    # "ai" always does; defaults to HYBRID_MODE
+    mode: Optional[Literal["auto", "local", "ai"]] = None
 
 class AnswerResponse(BaseModel):
     answer: str
     confidence: Optional[float] = None
     sources_used: Optional[List[str]] = None
 
+class BatchQuestionRequest(BaseModel):
+    questions: List[QuestionRequest]
+    stream: bool = False  # Stream NDJSON results as they finish instead of in order
+
 # Global cache for member data
 member_data_cache = {}
 cache_last_updated = None
+# Bumped whenever a refresh brings in different content; everything derived
+# from member_data_cache (context strings, indexes, answers) is keyed on it
+cache_generation = 0
+cache_content_hash = None
 
 # Configuration
 API_BASE_URL = "https://november7-730026606190.europe-west1.run.app"
 CACHE_DURATION_MINUTES = 10
+# Stale-while-revalidate: serve the cached snapshot and refresh it in the
+# background once it is older than the soft TTL; block on a refresh only
+# once it is older than the hard TTL
+CACHE_SOFT_TTL_SECONDS = float(os.getenv("CACHE_SOFT_TTL_SECONDS", str(CACHE_DURATION_MINUTES * 60)))
+CACHE_HARD_TTL_SECONDS = float(os.getenv("CACHE_HARD_TTL_SECONDS", "86400"))
+CACHE_SERVE_STALE_ON_ERROR = os.getenv("CACHE_SERVE_STALE_ON_ERROR", "true").lower() in ("1", "true", "yes")
+# Incremental sync: refreshes page in only the messages appended since the
+# last sync (skip/limit), with a periodic full resync to pick up edits
+CACHE_SYNC_MODE = os.getenv("CACHE_SYNC_MODE", "incremental")  # "incremental" or "full"
+CACHE_SYNC_PAGE_SIZE = int(os.getenv("CACHE_SYNC_PAGE_SIZE", "500"))
+CACHE_FULL_RESYNC_SECONDS = float(os.getenv("CACHE_FULL_RESYNC_SECONDS", "3600"))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 AI_MODEL = "gpt-4o"  # Can be changed to gpt-4 for better results
 
+# Hybrid answering: rule-based answers (as in main1.py) are served without
+# calling the AI when their confidence reaches the threshold. At 0.85 only
+# lookups naming one member in full whose every word the rules' fact list
+# covers are served; first-name-only matches (0.8) still go to the AI
+HYBRID_MODE = os.getenv("HYBRID_MODE", "auto")
+LOCAL_ANSWER_MIN_CONFIDENCE = float(os.getenv("LOCAL_ANSWER_MIN_CONFIDENCE", "0.85"))
+
+# Model routing: questions are classified locally and sent to the model for
+# their type; any question with a large mixed context goes to AI_MODEL (a
+# single member's full history is large but still a simple lookup)
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+MODEL_ROUTES = {
+    "lookup": "gpt-4o-mini",
+    "aggregation": AI_MODEL,
+    "comparison": AI_MODEL,
+    **json.loads(os.getenv("MODEL_ROUTES", "{}"))
+}
+ROUTER_LARGE_CONTEXT_TOKENS = int(os.getenv("ROUTER_LARGE_CONTEXT_TOKENS", "4000"))
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+
+# HTTP connection pool settings (one pool for the member API, one for OpenAI)
+MEMBER_API_MAX_CONNECTIONS = int(os.getenv("MEMBER_API_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Question-aware retrieval: only the top-K most relevant messages are sent to the model
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() in ("1", "true", "yes")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "60"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# "auto" uses tiktoken when it is installed and its encoding is available
+# locally, otherwise the built-in estimator; "estimate" always uses the estimator
+TOKENIZER = os.getenv("TOKENIZER", "auto").lower()
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+# Member-scoped context: questions naming up to MEMBER_CONTEXT_MAX_MEMBERS members
+# get all of those members' messages and nothing else, when they fit the budget
+MEMBER_CONTEXT_ENABLED = os.getenv("MEMBER_CONTEXT_ENABLED", "true").lower() in ("1", "true", "yes")
+MEMBER_CONTEXT_MAX_MEMBERS = int(os.getenv("MEMBER_CONTEXT_MAX_MEMBERS", "3"))
+MEMBER_CONTEXT_TOKEN_BUDGET = int(os.getenv("MEMBER_CONTEXT_TOKEN_BUDGET", "8000"))
+
+# Client-side OpenAI rate limits (0 disables a limit); off by default, set them
+# to the account's usage tier. Requests queue in arrival order for up to the max wait
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "20"))
+
+# Retries for transient OpenAI failures (429, 5xx, connection errors)
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv("AI_RETRY_BASE_DELAY_SECONDS", "0.5"))
+AI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("AI_RETRY_MAX_DELAY_SECONDS", "8"))
+AI_REQUEST_DEADLINE_SECONDS = float(os.getenv("AI_REQUEST_DEADLINE_SECONDS", "60"))
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Circuit breakers around the member data API and OpenAI: open once the failure
+# rate over the window reaches the threshold, then fail fast until the cool-down ends
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "30"))
+
+# Hedged OpenAI requests: if the first streamed chunk has not arrived after the
+# given percentile of recent time-to-first-chunk, fire a duplicate and keep the
+# faster one. Hedges are capped at AI_HEDGE_MAX_RATE of all requests
+AI_HEDGING_ENABLED = os.getenv("AI_HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+AI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("AI_HEDGE_DEFAULT_DELAY_SECONDS", "2.0"))
+AI_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AI_HEDGE_MIN_DELAY_SECONDS", "0.25"))
+AI_HEDGE_MAX_RATE = float(os.getenv("AI_HEDGE_MAX_RATE", "0.1"))
+
+# /ask-batch limits
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Exact-match answer cache (send "X-Cache-Bypass: true" to skip it)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Semantic answer cache: reuse answers for paraphrased questions about the same members
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1024"))
+
+def create_http_client(max_connections: int) -> httpx.AsyncClient:
+    """Create a pooled async HTTP client with keep-alive and optional HTTP/2"""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(HTTP_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+    return httpx.AsyncClient(
+        timeout=30.0,
+        follow_redirects=True,
+        limits=limits,
+        http2=HTTP2_ENABLED
+    )
+
+# Create a comprehensive prompt for the AI
+SYSTEM_PROMPT = """You are a precise data analyst for a luxury concierge service. Your job is to extract and report specific information from member service requests.
+
+ANALYSIS RULES:
+1. Answer ONLY with information explicitly stated in the member messages
+2. Quote specific dates, locations, restaurant names, and request details exactly as written
+3. If asked about preferences, extract them word-for-word from the messages
+4. For "how many" questions, use the precomputed statistics when given, otherwise count actual occurrences in the data
+5. For comparison questions, analyze all relevant members' data
+6. If information doesn't exist in the messages, state: "No information available in the data"
+
+RESPONSE FORMAT:
+- Give direct, factual answers without speculation
+- Include specific dates, numbers, and names when available
+- Use bullet points or numbered lists for multiple items
+- Cite member names exactly as they appear in the data
+- For trends/patterns, only mention what can be directly observed
+
+WHAT TO EXTRACT:
+- Restaurant reservations (name, date, party size)
+- Travel requests (destinations, dates, accommodation types)
+- Event tickets (venue, event type, quantity, dates)
+- Personal preferences (exact wording from messages)
+- Service feedback (positive/negative, specific comments)
+- Contact updates (phone numbers, addresses)
+- Special requirements (dietary, accessibility, room preferences)
+
+DO NOT:
+- Make assumptions beyond what's explicitly stated
+- Generalize from limited data
+- Add interpretive language like "seems to prefer" - use "requested" or "stated preference for"
+- Include information not present in the member messages"""
+# Bump whenever SYSTEM_PROMPT or the user prompt template changes so cached answers are not reused
+PROMPT_VERSION = "2"
+
+def get_message_items(member_data: Any) -> Tuple[List[Dict[str, Any]], int]:
+    """Return the valid message items and the reported total from an API payload"""
+    # Handle the actual API structure: {"total": 3349, "items": [...]}
+    if isinstance(member_data, dict) and "items" in member_data:
+        items = member_data["items"]
+        total_count = member_data.get("total", len(items))
+    elif isinstance(member_data, list):
+        items = member_data
+        total_count = len(items)
+    else:
+        return [], 0
+    
+    valid_items = [
+        item for item in items
+        if isinstance(item, dict) and "user_name" in item and "message" in item
+    ]
+    return valid_items, total_count
+
+class StreamingItemsParser:
+    """Incrementally parse a {"total": ..., "items": [...]} payload (or a bare list)
+    
+    feed() takes body chunks and returns the items completed so far, so the
+    raw body never has to be held in memory at once.
+    """
+    
+    def __init__(self, array_key: str = "items"):
+        self.array_key = array_key
+        self.json_decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.state = "start"
+        self.key: Optional[str] = None
+        self.top_level_list = False
+        self.fields: Dict[str, Any] = {}  # Top-level values other than the items
+    
+    def feed(self, chunk: bytes, final: bool = False) -> List[Any]:
+        self.buffer += self.text_decoder.decode(chunk, final)
+        buffer, position, items = self.buffer, 0, []
+        
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            
+            if self.state == "start" and char in "{[":
+                self.top_level_list = char == "["
+                self.state = "element_or_end" if self.top_level_list else "key_or_end"
+                position += 1
+            elif self.state == "key_or_end" and char == "}":
+                self.state = "done"
+                position += 1
+            elif self.state in ("key_or_end", "key") and char == '"':
+                value = self._decode(buffer, position, final)
+                if value is None:
+                    break
+                self.key, position = value
+                self.state = "colon"
+            elif self.state == "colon" and char == ":":
+                self.state = "value"
+                position += 1
+            elif self.state == "value" and self.key == self.array_key and char == "[":
+                self.state = "element_or_end"
+                position += 1
+            elif self.state == "value":
+                value = self._decode(buffer, position, final)
+                if value is None:
+                    break
+                self.fields[self.key], position = value
+                self.state = "after_value"
+            elif self.state == "after_value" and char in ",}":
+                self.state = "key" if char == "," else "done"
+                position += 1
+            elif self.state in ("element_or_end", "after_element") and char == "]":
+                self.state = "done" if self.top_level_list else "after_value"
+                position += 1
+            elif self.state == "after_element" and char == ",":
+                self.state = "element"
+                position += 1
+            elif self.state in ("element_or_end", "element"):
+                value = self._decode(buffer, position, final)
+                if value is None:
+                    break
+                item, position = value
+                items.append(item)
+                self.state = "after_element"
+            else:
+                raise ValueError(f"Unexpected {char!r} in member data payload")
+        
+        self.buffer = buffer[position:]
+        if final and self.state != "done":
+            raise ValueError("Truncated member data payload")
+        return items
+    
+    def _decode(self, buffer: str, position: int, final: bool) -> Optional[Tuple[Any, int]]:
+        """Decode one JSON value, or None if it may continue in the next chunk"""
+        try:
+            value, end = self.json_decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        # A number at the end of the buffer may be cut off ("33" of "3349")
+        if end == len(buffer) and not final:
+            return None
+        return value, end
+
+def load_token_encoder():
+    """Load the optional tiktoken encoder, or None to use the estimator"""
+    if TOKENIZER != "auto":
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        # Not installed, or the encoding cannot be loaded offline
+        return None
+
+token_encoder = load_token_encoder()
+
+# Pre-tokenizer similar to the GPT BPE splitter: words, numbers, punctuation
+TOKEN_PIECE_PATTERN = re.compile(r"[A-Za-z]+|[0-9]{1,3}|[^\sA-Za-z0-9]")
+
+# Approximate tokens for one member's header in a packed context, for size estimates
+MEMBER_SECTION_TOKENS = 15
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the GPT token count offline, without a tokenizer vocabulary"""
+    tokens = 0
+    for piece in TOKEN_PIECE_PATTERN.findall(text):
+        # Common words are a single token; long or rare words split every ~6 characters
+        tokens += 1 + (len(piece) - 1) // 6
+    # Newlines are usually separate tokens
+    return tokens + text.count("\n")
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the local tokenizer, falling back to the estimator"""
+    if token_encoder is not None:
+        return len(token_encoder.encode(text))
+    return estimate_tokens(text)
+
+class ContextBuilder:
+    """Packs member messages into a context string within a token budget"""
+    
+    def __init__(self, header_lines: List[str], token_budget: int):
+        self.header_lines = header_lines
+        self.token_budget = token_budget
+        self.tokens_used = count_tokens("\n".join(header_lines))
+        self.members: Dict[str, List[Tuple[str, str]]] = {}
+        self.messages_included = 0
+    
+    def add(self, user_name: str, message: str, timestamp: str) -> bool:
+        """Add a message if it fits in the budget; returns False when it does not"""
+        line = f"[{timestamp[:10] if timestamp else 'Unknown date'}] {message}"
+        line_tokens = count_tokens(line) + 1
+        if user_name not in self.members:
+            line_tokens += count_tokens(f"\nMEMBER: {user_name}\n" + "-" * 30) + 1
+        
+        if self.tokens_used + line_tokens > self.token_budget:
+            return False
+        
+        self.members.setdefault(user_name, []).append((timestamp, line))
+        self.tokens_used += line_tokens
+        self.messages_included += 1
+        return True
+    
+    def render(self, omitted: Optional[Dict[str, int]] = None) -> str:
+        """Render members in the order they were added, messages chronologically"""
+        context_parts = list(self.header_lines)
+        for member_name, entries in self.members.items():
+            context_parts.append(f"\nMEMBER: {member_name}")
+            context_parts.append("-" * 30)
+            for _, line in sorted(entries, key=lambda entry: entry[0]):
+                context_parts.append(line)
+            
+            if omitted and omitted.get(member_name):
+                context_parts.append(f"... and {omitted[member_name]} more messages")
+            
+            context_parts.append("")  # Add spacing
+        
+        return "\n".join(context_parts)
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "is", "are",
+    "was", "were", "be", "has", "have", "had", "do", "does", "did", "what", "which",
+    "who", "whom", "when", "where", "why", "how", "with", "from", "by", "about", "as",
+    "it", "its", "that", "this", "these", "those", "i", "me", "my", "you", "your",
+    "he", "she", "his", "her", "they", "them", "their", "we", "our", "any", "all",
+    "s", "can", "could", "would", "should", "will", "please", "there", "much", "many"
+}
+
+def tokenize_for_search(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [
+        token for token in re.findall(r"[a-z0-9]+", text.lower())
+        if token not in STOPWORDS
+    ]
+
+class MessageIndex:
+    """In-memory BM25 inverted index over all member messages"""
+    
+    def __init__(self, items: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.items: List[Dict[str, Any]] = []
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.total_doc_length = 0
+        self.extend(items)
+    
+    def extend(self, items: List[Dict[str, Any]]):
+        """Add messages to the index"""
+        for item in items:
+            doc_id = len(self.items)
+            self.items.append(item)
+            
+            # Index the member name with the message so name mentions match
+            tokens = tokenize_for_search(f"{item['user_name']} {item['message']}")
+            self.doc_lengths.append(len(tokens))
+            self.total_doc_length += len(tokens)
+            
+            term_counts: Dict[str, int] = {}
+            for token in tokens:
+                term_counts[token] = term_counts.get(token, 0) + 1
+            for term, count in term_counts.items():
+                self.postings.setdefault(term, []).append((doc_id, count))
+        
+        self.avg_doc_length = (self.total_doc_length / len(self.doc_lengths)) if self.doc_lengths else 0.0
+    
+    @classmethod
+    def from_member_data(cls, member_data: Any) -> "MessageIndex":
+        items, _ = get_message_items(member_data)
+        return cls(items)
+    
+    def search(self, query: str, top_k: int,
+               members: Optional[frozenset] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return the top_k (score, item) pairs for the query, best first
+        
+        With members, only those members' messages are considered.
+        """
+        doc_count = len(self.items)
+        if not doc_count:
+            return []
+        
+        scores: Dict[int, float] = {}
+        for term in set(tokenize_for_search(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, term_freq in postings:
+                if members is not None and self.items[doc_id]["user_name"] not in members:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (
+                    term_freq * (self.k1 + 1) / (term_freq + self.k1 * length_norm)
+                )
+        
+        best = heapq.nlargest(top_k, scores.items(), key=lambda entry: entry[1])
+        return [(score, self.items[doc_id]) for doc_id, score in best]
+    
+    def match_count(self, query: str) -> int:
+        """Upper bound on the messages a search for the query can return, without scoring"""
+        return sum(len(self.postings.get(term, ())) for term in set(tokenize_for_search(query)))
+
+COMPARISON_PATTERN = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|difference between|differ|more than|less than|"
+    r"fewer than|both|similar|same as|whereas)\b"
+)
+AGGREGATION_PATTERN = re.compile(
+    r"\b(how many|how often|count|number of|most|least|total|average|top \d*|every|all members|"
+    r"each member|which members?|who (has|have|had|is|are|sent|made|booked|requested)|rank|trend|pattern|"
+    r"summar(y|ize|ise)|overall|frequent(ly)?)\b"
+)
+
+def classify_question(question: str, mentioned_member_count: int = 0) -> str:
+    """Classify a question as a lookup, aggregation or comparison question"""
+    question_lower = question.lower()
+    if mentioned_member_count > 1 or COMPARISON_PATTERN.search(question_lower):
+        return "comparison"
+    if AGGREGATION_PATTERN.search(question_lower):
+        return "aggregation"
+    return "lookup"
+
+# Local analytics: exact counts over every cached message, so statistics
+# questions do not depend on the few messages the model gets to see.
+# A message can fall in several categories.
+MESSAGE_CATEGORIES = {
+    "restaurants": re.compile(r"\b(restaurants?|dinner|lunch|brunch|table|dining)\b"),
+    "travel": re.compile(r"\b(trips?|travel|flights?|fly|villa|hotels?|vacation|jet)\b"),
+    "events": re.compile(r"\b(tickets?|concerts?|opera|shows?|games?|events?)\b"),
+    "transport": re.compile(r"\b(cars?|chauffeur|driver|vehicles?|transfer)\b"),
+    "preferences": re.compile(r"\b(prefer|preferences?|favou?rite|always|vegan|allerg(y|ic))\b"),
+    "account updates": re.compile(r"\b(phone number|address|payment|credit card|profile|update my)\b"),
+}
+MONTHS = {
+    name: number for number, name in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"], 1
+    )
+}
+# Only counts of messages or members are answered locally; "how many cars does X
+# own" is about the world rather than the messages and goes to the AI
+MESSAGE_COUNT_PATTERN = re.compile(
+    r"\b((how many|number of)\s+(\w+\s+)?(messages|requests|reservations|bookings|times)|total messages)\b"
+)
+MEMBER_COUNT_PATTERN = re.compile(
+    r"\b(how many|number of)\s+(members|people|users|clients)\s+"
+    r"(have|has|had|sent|made|booked|requested|asked|mentioned|wrote|are there)\b"
+)
+RANKING_PATTERN = re.compile(r"\btop (\d+)\b|\b(who|which members?)\b.*\b(most|least|fewest)\b")
+ASCENDING_PATTERN = re.compile(r"\b(least|fewest)\b")
+TEMPORAL_PATTERN = re.compile(
+    r"\b(when|today|yesterday|week|month|year|recent(ly)?|last|latest|since|before|after|"
+    r"between|during|ago|" + "|".join(MONTHS) + r"|\d{4})\b"
+)
+# Words a statistics question can use without narrowing what is counted. Any
+# other word (a place, a restaurant name, "mention") is a filter the counts
+# cannot apply, so the question goes to the AI instead
+STATS_QUERY_WORDS = STOPWORDS | {
+    "number", "total", "count", "message", "messages", "request", "requests", "reservations",
+    "bookings", "times", "member", "members", "people", "users", "clients", "sent", "send",
+    "made", "make", "booked", "requested", "asked", "wrote", "written", "top", "most", "least",
+    "fewest", "often", "overall", "ever", "altogether", "so", "far", "since", "after", "before",
+    "between", "until", "each", "every", "per"
+}
+STATS_DATE_PHRASE = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}\b|\b(" + "|".join(MONTHS) + r")\b|\b\d{4}\b|\btop \d+\b"
+)
+
+def message_categories(message: str) -> frozenset:
+    """The categories a message belongs to"""
+    message_lower = message.lower()
+    return frozenset(name for name, pattern in MESSAGE_CATEGORIES.items() if pattern.search(message_lower))
+
+def parse_date_range(question_lower: str) -> Optional[Tuple[str, str]]:
+    """The inclusive (start, end) ISO dates a question is limited to, "" for an open end
+    
+    Returns None if the question has temporal wording that cannot be parsed.
+    """
+    dates = re.findall(r"\b\d{4}-\d{2}-\d{2}\b", question_lower)
+    month_year = re.search(r"\bin (" + "|".join(MONTHS) + r") (\d{4})\b", question_lower)
+    year = re.search(r"\bin (\d{4})\b(?!-)", question_lower)
+    
+    try:
+        if len(dates) == 2 and re.search(r"\b(between|from)\b", question_lower):
+            start, end = sorted(dates)
+            return start, end
+        if len(dates) == 1 and re.search(r"\b(since|from)\b", question_lower):
+            return dates[0], ""
+        if len(dates) == 1 and re.search(r"\bafter\b", question_lower):
+            return (date.fromisoformat(dates[0]) + timedelta(days=1)).isoformat(), ""
+        if len(dates) == 1 and re.search(r"\bbefore\b", question_lower):
+            return "", (date.fromisoformat(dates[0]) - timedelta(days=1)).isoformat()
+        if len(dates) == 1 and re.search(r"\bon\b", question_lower):
+            return dates[0], dates[0]
+    except ValueError:
+        return None
+    if month_year:
+        month = MONTHS[month_year.group(1)]
+        return f"{month_year.group(2)}-{month:02d}-01", f"{month_year.group(2)}-{month:02d}-31"
+    if year:
+        return f"{year.group(1)}-01-01", f"{year.group(1)}-12-31"
+    
+    if TEMPORAL_PATTERN.search(question_lower):
+        return None
+    return "", ""
+
+def stats_query_covers(question_lower: str, query: Dict[str, Any]) -> bool:
+    """True if every content word of the question is covered by the query's member, category or dates"""
+    text = STATS_DATE_PHRASE.sub(" ", question_lower)
+    if query["category"]:
+        text = MESSAGE_CATEGORIES[query["category"]].sub(" ", text)
+    covered = set(STATS_QUERY_WORDS)
+    if query["member"]:
+        covered.update(re.findall(r"\w+", query["member"].lower()))
+    return all(word in covered for word in re.findall(r"\w+", text))
+
+def parse_stats_query(question: str, mentioned: frozenset) -> Optional[Dict[str, Any]]:
+    """Turn a statistics question into a query for MessageStats, or None if it is not one"""
+    if classify_question(question, len(mentioned)) != "aggregation":
+        return None
+    question_lower = question.lower()
+    
+    date_range = parse_date_range(question_lower)
+    categories = [name for name, pattern in MESSAGE_CATEGORIES.items() if pattern.search(question_lower)]
+    if date_range is None or len(categories) > 1:
+        return None
+    
+    query = {
+        "member": next(iter(mentioned), None),
+        "category": categories[0] if categories else None,
+        "start": date_range[0],
+        "end": date_range[1]
+    }
+    
+    if not stats_query_covers(question_lower, query):
+        return None
+    
+    ranking = RANKING_PATTERN.search(question_lower)
+    if ranking and not query["member"]:
+        top_n = int(ranking.group(1)) if ranking.group(1) else 1
+        ascending = bool(ASCENDING_PATTERN.search(question_lower))
+        return {**query, "metric": "top_members", "top_n": top_n, "ascending": ascending}
+    if MEMBER_COUNT_PATTERN.search(question_lower) and not query["member"]:
+        return {**query, "metric": "members"}
+    if MESSAGE_COUNT_PATTERN.search(question_lower):
+        return {**query, "metric": "messages"}
+    return None
+
+class MessageStats:
+    """Per-member and per-category message counts with date range filters"""
+    
+    def __init__(self, records: List[Tuple[str, str, frozenset]], total: int):
+        # (date, member, categories), sorted by date on first lookup after a change
+        self.records = records
+        self.dates: List[str] = []
+        self.total = total
+        self.needs_sort = True
+    
+    @staticmethod
+    def record(item: Dict[str, Any]) -> Tuple[str, str, frozenset]:
+        return item.get("timestamp", "")[:10], item["user_name"], message_categories(item["message"])
+    
+    @classmethod
+    def from_member_data(cls, member_data: Any) -> "MessageStats":
+        items, total = get_message_items(member_data)
+        return cls([cls.record(item) for item in items], total)
+    
+    def extend(self, items: List[Dict[str, Any]]):
+        """Add messages"""
+        self.records.extend(self.record(item) for item in items)
+        self.total += len(items)
+        self.needs_sort = True
+    
+    def select(self, member: Optional[str] = None, category: Optional[str] = None,
+               start: str = "", end: str = "") -> List[Tuple[str, str, frozenset]]:
+        """Records matching all of the given filters"""
+        if self.needs_sort:
+            self.records.sort(key=lambda record: record[0])
+            self.dates = [record[0] for record in self.records]
+            self.needs_sort = False
+        
+        low = bisect.bisect_left(self.dates, start) if start else 0
+        high = bisect.bisect_right(self.dates, end) if end else len(self.records)
+        return [
+            record for record in self.records[low:high]
+            if (member is None or record[1] == member) and (category is None or category in record[2])
+        ]
+    
+    def member_counts(self, **filters) -> Counter:
+        """Message counts per member"""
+        return Counter(member for _, member, _ in self.select(**filters))
+    
+    def category_counts(self, **filters) -> Counter:
+        """Message counts per category"""
+        return Counter(category for _, _, categories in self.select(**filters) for category in categories)
+    
+    def answer(self, query: Dict[str, Any]) -> str:
+        """Answer a query from parse_stats_query"""
+        filters = {key: query[key] for key in ("member", "category", "start", "end")}
+        about = f" about {query['category']}" if query["category"] else ""
+        if query["start"] and query["end"]:
+            period = f" on {query['start']}" if query["start"] == query["end"] else f" between {query['start']} and {query['end']}"
+        elif query["start"]:
+            period = f" since {query['start']}"
+        elif query["end"]:
+            period = f" up to {query['end']}"
+        else:
+            period = ""
+        
+        if query["metric"] == "messages":
+            count = len(self.select(**filters))
+            subject = query["member"] or "Members together"
+            return f"{subject} sent {count} message{'s' if count != 1 else ''}{about}{period}."
+        
+        counts = self.member_counts(**filters)
+        if query["metric"] == "members":
+            return f"{len(counts)} member{'s' if len(counts) != 1 else ''} sent messages{about}{period}."
+        
+        if not counts:
+            return f"No messages{about}{period} in the data."
+        # Members with no matching messages rank fewest, so every member starts at 0
+        ranking = dict.fromkeys(self.member_counts(), 0) if query["ascending"] else {}
+        ranking.update(counts)
+        ranked = sorted(ranking.items(), key=lambda entry: (entry[1] if query["ascending"] else -entry[1], entry[0]))
+        most = "fewest" if query["ascending"] else "most"
+        if query["top_n"] == 1:
+            member, count = ranked[0]
+            return f"{member} sent the {most} messages{about}{period} ({count})."
+        lines = [f"{rank}. {member}: {count}" for rank, (member, count) in enumerate(ranked[:query["top_n"]], 1)]
+        return f"Members with the {most} messages{about}{period}:\n" + "\n".join(lines)
+    
+    def facts(self, members: frozenset) -> str:
+        """Precomputed statistics to put in front of the AI context"""
+        per_member = self.member_counts()
+        lines = [
+            f"Precomputed statistics over all {self.total} messages (exact counts):",
+            "- Messages per member: " + ", ".join(f"{member}: {count}" for member, count in per_member.most_common(50)),
+            "- Messages per category: " + ", ".join(f"{category}: {count}" for category, count in self.category_counts().most_common())
+        ]
+        for member in sorted(members):
+            records = self.select(member=member)
+            if records:
+                categories = ", ".join(f"{category}: {count}" for category, count in self.category_counts(member=member).most_common())
+                lines.append(
+                    f"- {member}: {len(records)} messages from {records[0][0]} to {records[-1][0]}"
+                    + (f"; {categories}" if categories else "")
+                )
+        return "\n".join(lines)
+
+class MemberSummaryIndex:
+    """Per-member message count, first/latest message and category counts"""
+    
+    def __init__(self):
+        self.summaries: Dict[str, Dict[str, Any]] = {}
+        self.total_messages = 0
+    
+    @classmethod
+    def from_member_data(cls, member_data: Any) -> "MemberSummaryIndex":
+        index = cls()
+        items, _ = get_message_items(member_data)
+        index.extend(items)
+        return index
+    
+    def extend(self, items: List[Dict[str, Any]]):
+        """Add messages"""
+        for item in items:
+            self.add(item)
+    
+    def add(self, item: Dict[str, Any]):
+        """Fold one message into its member's summary"""
+        timestamp = item.get("timestamp", "")
+        summary = self.summaries.get(item["user_name"])
+        if summary is None:
+            summary = self.summaries[item["user_name"]] = {
+                "message_count": 0,
+                "first_timestamp": timestamp,
+                "latest_message": "",
+                "latest_timestamp": "",
+                "categories": Counter()
+            }
+        
+        summary["message_count"] += 1
+        summary["categories"].update(message_categories(item["message"]))
+        # ISO 8601 timestamps order correctly as strings
+        if timestamp < summary["first_timestamp"]:
+            summary["first_timestamp"] = timestamp
+        if timestamp > summary["latest_timestamp"]:
+            summary["latest_message"] = item["message"][:100]
+            summary["latest_timestamp"] = timestamp
+        self.total_messages += 1
+    
+    def query(self, search: Optional[str] = None, category: Optional[str] = None, min_messages: int = 0,
+              sort: str = "name", descending: bool = False) -> List[Tuple[str, Dict[str, Any]]]:
+        """Filtered and sorted (member, summary) pairs"""
+        search_lower = search.lower() if search else None
+        matches = [
+            (name, summary) for name, summary in self.summaries.items()
+            if (search_lower is None or search_lower in name.lower())
+            and (category is None or summary["categories"][category] > 0)
+            and summary["message_count"] >= min_messages
+        ]
+        if sort == "name":
+            matches.sort(key=lambda entry: entry[0].lower(), reverse=descending)
+        else:
+            matches.sort(key=lambda entry: entry[1][sort], reverse=descending)
+        return matches
+
+def normalize_question(question: str) -> str:
+    """Normalize question text for cache lookups"""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+class AnswerCache:
+    """LRU + TTL cache of AI answers keyed on question, model, prompt and data generation"""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def make_key(self, question: str, model: str, generation: int) -> Tuple:
+        return (normalize_question(question), model, PROMPT_VERSION, generation)
+    
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key: Tuple, value: Dict[str, Any]):
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS)
+
+# Domain words that mean the same thing in member questions; generic verbs fold to ""
+CONCEPT_SYNONYMS = {
+    "trip": "travel", "journey": "travel", "vacation": "travel", "holiday": "travel",
+    "visit": "travel", "destination": "travel", "flight": "travel", "fly": "travel",
+    "restaurant": "dining", "dinner": "dining", "lunch": "dining", "table": "dining",
+    "eat": "dining", "food": "dining", "dine": "dining",
+    "prefer": "preference", "preference": "preference", "like": "preference", "favorite": "preference", "favourite": "preference",
+    "ticket": "event", "show": "event", "concert": "event", "game": "event",
+    "car": "vehicle", "vehicle": "vehicle",
+    "phone": "contact", "address": "contact", "email": "contact",
+    "most": "rank", "top": "rank", "frequent": "rank",
+    "book": "", "reserve": "", "reservation": "", "arrange": "", "plan": "", "planned": "",
+    "tell": "", "know": "", "request": "", "ask": "", "make": "", "made": "", "go": "", "going": ""
+}
+
+# Question words that change what is being asked ("when" vs "how many"); cached
+# answers are only reused for questions with exactly the same ones
+QUESTION_WORDS = {"when", "who", "how", "many", "much"}
+# Words a rule-based answer covers besides the member's name and its category
+# keywords; anything else (a restaurant name, a place, a date, "window seats")
+# asks for more than the rules' fact list
+RULE_ANSWER_WORDS = STOPWORDS | {
+    "made", "make", "booked", "book", "reservation", "reservations", "reserved", "requested",
+    "request", "requests", "asked", "been", "gone", "went", "traveled", "travelled",
+    "mentioned", "usually", "tell", "know", "list", "places"
+}
+RULE_TOPIC_PATTERNS = dict(QUESTION_TOPICS)
+
+def question_intent(question: str) -> frozenset:
+    """The question words in a question"""
+    return frozenset(token for token in re.findall(r"[a-z]+", question.lower()) if token in QUESTION_WORDS)
+
+def rule_facts_complete(details: Dict[str, Any]) -> bool:
+    """True if a rule-based answer lists every fact found and none looks like extraction noise
+    
+    The regex rules leave fragments ("s" from "tour of ...") and doubled spaces
+    where noise words were stripped ("Nobu  Friday").
+    """
+    listed = details.get("facts_listed", [])
+    if details["facts_found"] > len(listed):
+        return False
+    return all(len(fact.strip()) >= 3 and "  " not in fact for fact in listed)
+
+def rule_answer_covers(question: str, member: str, category: str) -> bool:
+    """True if the member's name and the rules' category keywords cover every content word of the question"""
+    text = question.lower()
+    if category in RULE_TOPIC_PATTERNS:
+        text = RULE_TOPIC_PATTERNS[category].sub(" ", text)
+    covered = RULE_ANSWER_WORDS | set(re.findall(r"\w+", member.lower()))
+    return all(word in covered for word in re.findall(r"\w+", text))
+
+def canonical_term(token: str) -> str:
+    """Crudely stem a token and fold it onto its domain concept"""
+    if token in CONCEPT_SYNONYMS:
+        return CONCEPT_SYNONYMS[token]
+    stems = [
+        token[:-len(suffix)] for suffix in ("ing", "ed", "es", "s")
+        if token.endswith(suffix) and len(token) - len(suffix) > 2
+    ]
+    for stem in stems:
+        if stem in CONCEPT_SYNONYMS:
+            return CONCEPT_SYNONYMS[stem]
+    long_stems = [stem for stem in stems if len(stem) > 3]
+    return long_stems[0] if long_stems else token
+
+class HashingEmbedder:
+    """CPU-only question embeddings via the hashing trick (no model download)"""
+    
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+    
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        # crc32 is stable across processes, unlike hash()
+        hashed = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if hashed & 0x80000000 else -1.0
+        vector[hashed % self.dimensions] += sign * weight
+    
+    def embed(self, text: str, exclude: Optional[set] = None) -> np.ndarray:
+        """L2-normalized embedding of the text, ignoring tokens in exclude"""
+        terms = [
+            term for term in (
+                canonical_term(token) for token in tokenize_for_search(text)
+                if not exclude or token not in exclude
+            )
+            if term
+        ]
+        
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for term in terms:
+            self._add(vector, f"w:{term}", 1.0)
+            # Character trigrams tolerate spelling and inflection differences
+            padded = f"#{term}#"
+            for i in range(len(padded) - 2):
+                self._add(vector, f"c:{padded[i:i + 3]}", 0.3)
+        for first, second in zip(terms, terms[1:]):
+            self._add(vector, f"b:{first} {second}", 0.5)
+        
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class SemanticAnswerCache:
+    """NumPy-backed nearest-neighbour cache of answers to similar questions
+    
+    Entries only match questions that mention exactly the same members and ask
+    with the same question words, for the same model, prompt version and data
+    generation.
+    """
+    
+    def __init__(self, max_entries: int, threshold: float, embedder: HashingEmbedder):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.embedder = embedder
+        self.vectors = np.zeros((max_entries, embedder.dimensions), dtype=np.float32)
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self.next_slot = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def lookup(self, question: str, model: str, generation: int, members: frozenset) -> Optional[Dict[str, Any]]:
+        if not self.size:
+            self.misses += 1
+            return None
+        
+        query = self.embedder.embed(question, exclude=self.name_tokens(members))
+        similarities = self.vectors[:self.size] @ query
+        intent = question_intent(question)
+        
+        # Best candidate that is in scope and still fresh
+        now = time.monotonic()
+        for slot in np.argsort(similarities)[::-1]:
+            if similarities[slot] < self.threshold:
+                break
+            entry = self.entries[slot]
+            if (entry["model"] == model and entry["generation"] == generation and
+                    entry["prompt_version"] == PROMPT_VERSION and entry["members"] == members and
+                    entry["intent"] == intent and now - entry["created"] <= ANSWER_CACHE_TTL_SECONDS):
+                self.hits += 1
+                return {**entry["value"], "similarity": round(float(similarities[slot]), 3)}
+        
+        self.misses += 1
+        return None
+    
+    def add(self, question: str, model: str, generation: int, members: frozenset, value: Dict[str, Any]):
+        # Ring buffer: once full, the oldest entry is overwritten
+        slot = self.next_slot
+        self.vectors[slot] = self.embedder.embed(question, exclude=self.name_tokens(members))
+        self.entries[slot] = {
+            "model": model,
+            "generation": generation,
+            "prompt_version": PROMPT_VERSION,
+            "members": members,
+            "intent": question_intent(question),
+            "created": time.monotonic(),
+            "value": value
+        }
+        self.next_slot = (slot + 1) % self.max_entries
+        self.size = min(self.size + 1, self.max_entries)
+    
+    def name_tokens(self, members: frozenset) -> set:
+        return {token for member in members for token in tokenize_for_search(member)}
+    
+    def clear(self):
+        self.vectors[:] = 0
+        self.entries = [None] * self.max_entries
+        self.next_slot = 0
+        self.size = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "size": self.size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None
+        }
+
+semantic_cache = SemanticAnswerCache(
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_THRESHOLD,
+    HashingEmbedder(EMBEDDING_DIMENSIONS)
+)
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity-per-minute"""
+    
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = float(capacity_per_minute)
+        self.available = float(capacity_per_minute)
+        self.refill_per_second = capacity_per_minute / 60.0
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+    
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= amount
+    
+    def refund(self, amount: float):
+        """Give back (or, if negative, take) tokens after the real cost is known"""
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+class RateLimiter:
+    """Client-side requests-per-minute and tokens-per-minute limiter for OpenAI calls
+    
+    Callers queue in arrival order; the head of the queue sleeps until both
+    buckets can cover its request, or fails once it would exceed the max wait.
+    """
+    
+    def __init__(self, rpm: int, tpm: int, max_wait_seconds: float):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.rejected = 0
+    
+    async def acquire(self, estimated_tokens: int):
+        """Wait for capacity for one request of roughly estimated_tokens"""
+        if self.requests is None and self.tokens is None:
+            return
+        
+        deadline = time.monotonic() + self.max_wait_seconds
+        self.waiting += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, which keeps the queue fair
+            await asyncio.wait_for(self._lock.acquire(), timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self.waiting -= 1
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="AI service rate limit exceeded")
+        
+        try:
+            while True:
+                wait = max(
+                    self.requests.wait_time(1) if self.requests else 0.0,
+                    self.tokens.wait_time(estimated_tokens) if self.tokens else 0.0
+                )
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self.rejected += 1
+                    raise HTTPException(status_code=503, detail="AI service rate limit exceeded")
+                await asyncio.sleep(wait)
+            
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(estimated_tokens)
+        finally:
+            self.waiting -= 1
+            self._lock.release()
+    
+    def try_acquire(self, estimated_tokens: int) -> bool:
+        """Take capacity only if it is available right now and nobody is queued"""
+        if self._lock.locked():
+            return False
+        if self.requests and self.requests.wait_time(1) > 0:
+            return False
+        if self.tokens and self.tokens.wait_time(estimated_tokens) > 0:
+            return False
+        
+        if self.requests:
+            self.requests.consume(1)
+        if self.tokens:
+            self.tokens.consume(estimated_tokens)
+        return True
+    
+    def record_usage(self, estimated_tokens: int, usage: Dict[str, Any]):
+        """Correct the token bucket with the usage block from the response"""
+        if self.tokens and usage.get("total_tokens"):
+            self.tokens.refund(estimated_tokens - usage["total_tokens"])
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rpm_limit": int(self.requests.capacity) if self.requests else None,
+            "tpm_limit": int(self.tokens.capacity) if self.tokens else None,
+            "requests_available": round(self.requests.available, 1) if self.requests else None,
+            "tokens_available": round(self.tokens.available) if self.tokens else None,
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
+
+rate_limiter = RateLimiter(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, RATE_LIMIT_MAX_WAIT_SECONDS)
+
+class HedgingPolicy:
+    """Decides when to hedge an OpenAI request from observed time-to-first-chunk"""
+    
+    def __init__(self, enabled: bool, percentile: float, default_delay: float,
+                 min_delay: float, max_rate: float, sample_size: int = 200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_rate = max_rate
+        self.samples: deque = deque(maxlen=sample_size)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    def delay(self) -> float:
+        """Seconds to wait for the first chunk before hedging"""
+        if len(self.samples) < 20:
+            return self.default_delay
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+    
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+    
+    def allow_hedge(self) -> bool:
+        return self.hedges + 1 <= self.max_rate * self.requests
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "delay_seconds": round(self.delay(), 3),
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+hedging_policy = HedgingPolicy(
+    AI_HEDGING_ENABLED,
+    AI_HEDGE_PERCENTILE,
+    AI_HEDGE_DEFAULT_DELAY_SECONDS,
+    AI_HEDGE_MIN_DELAY_SECONDS,
+    AI_HEDGE_MAX_RATE
+)
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker over a sliding failure-rate window
+    
+    While open, calls are rejected immediately. After the cool-down a single
+    probe call is let through (half-open): success closes the circuit, failure
+    opens it again.
+    """
+    
+    def __init__(self, name: str, failure_rate: float, min_calls: int,
+                 window_seconds: float, cooldown_seconds: float):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.outcomes: deque = deque()  # (timestamp, succeeded)
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self.rejected = 0
+    
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        now = time.monotonic()
+        if self.state == "open":
+            if now - self.opened_at < self.cooldown_seconds:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+            self.probe_started_at = None
+        
+        if self.state == "half_open":
+            # One probe at a time; a probe that never reported back is abandoned after the cool-down
+            if self.probe_started_at is not None and now - self.probe_started_at < self.cooldown_seconds:
+                self.rejected += 1
+                return False
+            self.probe_started_at = now
+        
+        return True
+    
+    def record_success(self):
+        if self.state == "half_open":
+            self.state = "closed"
+            self.outcomes.clear()
+            self.probe_started_at = None
+            return
+        self._record(True)
+    
+    def record_failure(self):
+        if self.state == "half_open":
+            self._open()
+            return
+        self._record(False)
+        
+        failures = sum(1 for _, succeeded in self.outcomes if not succeeded)
+        if (self.state == "closed" and len(self.outcomes) >= self.min_calls and
+                failures / len(self.outcomes) >= self.failure_rate):
+            self._open()
+    
+    def _record(self, succeeded: bool):
+        now = time.monotonic()
+        self.outcomes.append((now, succeeded))
+        while self.outcomes and now - self.outcomes[0][0] > self.window_seconds:
+            self.outcomes.popleft()
+    
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.probe_started_at = None
+    
+    def stats(self) -> Dict[str, Any]:
+        failures = sum(1 for _, succeeded in self.outcomes if not succeeded)
+        return {
+            "state": self.state,
+            "calls_in_window": len(self.outcomes),
+            "failures_in_window": failures,
+            "rejected": self.rejected,
+            "retry_in_seconds": (
+                round(max(0.0, self.cooldown_seconds - (time.monotonic() - self.opened_at)), 1)
+                if self.state == "open" else None
+            )
+        }
+
+def is_outage_error(error: Exception) -> bool:
+    """Whether an error means the dependency itself is failing (counts against its breaker)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+member_api_breaker = CircuitBreaker(
+    "member_api", CIRCUIT_FAILURE_RATE, CIRCUIT_MIN_CALLS, CIRCUIT_WINDOW_SECONDS, CIRCUIT_COOLDOWN_SECONDS
+)
+llm_breaker = CircuitBreaker(
+    "llm", CIRCUIT_FAILURE_RATE, CIRCUIT_MIN_CALLS, CIRCUIT_WINDOW_SECONDS, CIRCUIT_COOLDOWN_SECONDS
+)
+
+async def anext_or_none(stream: AsyncIterator[Any]) -> Any:
+    """Next item of an async iterator, or None once it is exhausted"""
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait according to the Retry-After (or retry-after-ms) header"""
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """Delay before retrying after a failed attempt, or None if it should not be retried"""
+    if isinstance(error, httpx.HTTPStatusError):
+        if error.response.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        retry_after = parse_retry_after(error.response)
+        if retry_after is not None:
+            return retry_after
+    elif not isinstance(error, httpx.TransportError):
+        return None
+    
+    # Capped exponential backoff with full jitter
+    return random.uniform(0, min(AI_RETRY_MAX_DELAY_SECONDS, AI_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+
+# Rule-based extractor shared with the v1 system
+rule_analyzer = MemberDataAnalyzer()
+
+# How often each path produced the answer
+answer_path_counts = {"local": 0, "cache": 0, "ai": 0}
+
 class AIQuestionAnswering:
     def __init__(self):
         self.openai_headers = {
             "Authorization": f"Bearer {OPENAI_API_KEY}",
             "Content-Type": "application/json"
         }
+        self.member_api_client: Optional[httpx.AsyncClient] = None
+        self.openai_client: Optional[httpx.AsyncClient] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.last_refresh_error: Optional[str] = None
+        self._derived: Dict[str, Any] = {}
+        self._derived_generation: Optional[int] = None
+        self._derived_source: Any = None
+        # Derived values of the snapshot the last refresh replaced, for requests
+        # (such as a batch) that are still answering from it
+        self._previous_source: Any = None
+        self._previous_derived: Dict[str, Any] = {}
+        # (snapshot, task) of the member records build in progress
+        self._records_build: Optional[Tuple[Any, asyncio.Future]] = None
+        # Position in the upstream message list for incremental sync
+        self.sync_state: Optional[Dict[str, Any]] = None
+        self.last_full_sync: Optional[datetime] = None
+    
+    def open_clients(self):
+        """Create the shared connection pools used by every outbound call"""
+        if self.member_api_client is None or self.member_api_client.is_closed:
+            self.member_api_client = create_http_client(MEMBER_API_MAX_CONNECTIONS)
+        if self.openai_client is None or self.openai_client.is_closed:
+            self.openai_client = create_http_client(OPENAI_MAX_CONNECTIONS)
+    
+    async def close_clients(self):
+        """Close the shared connection pools"""
+        for client in (self.member_api_client, self.openai_client):
+            if client is not None and not client.is_closed:
+                await client.aclose()
+        self.member_api_client = None
+        self.openai_client = None
+    
+    def get_member_api_client(self) -> httpx.AsyncClient:
+        """Return the pooled member API client, opening the pools if needed"""
+        if self.member_api_client is None or self.member_api_client.is_closed:
+            self.open_clients()
+        return self.member_api_client
+    
+    def get_openai_client(self) -> httpx.AsyncClient:
+        """Return the pooled OpenAI client, opening the pools if needed"""
+        if self.openai_client is None or self.openai_client.is_closed:
+            self.open_clients()
+        return self.openai_client
+    
+    async def fetch_member_data(self) -> Dict[str, Any]:
+        """Fetch member data from the API with stale-while-revalidate caching"""
+        cache_age = self.cache_age_seconds()
+        
+        if member_data_cache and cache_age is not None:
+            # Fresh snapshot
+            if cache_age < CACHE_SOFT_TTL_SECONDS:
+                return member_data_cache
+            
+            # Stale but usable snapshot: serve it and refresh in the background
+            if cache_age < CACHE_HARD_TTL_SECONDS:
+                self.start_refresh()
+                return member_data_cache
+        
+        try:
+            # Coalesce concurrent refreshes: only one download is in flight and
+            # every waiter shares its result (or its error)
+            return await asyncio.shield(self.start_refresh())
+        except HTTPException:
+            # Upstream is down - fall back to the last good snapshot
+            if member_data_cache and CACHE_SERVE_STALE_ON_ERROR:
+                return member_data_cache
+            raise
+    
+    def cache_age_seconds(self) -> Optional[float]:
+        """Seconds since the member data cache was last refreshed"""
+        if not cache_last_updated:
+            return None
+        return (datetime.now() - cache_last_updated).total_seconds()
+    
+    def start_refresh(self) -> asyncio.Task:
+        """Start a member data refresh unless one is already in flight"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_member_data())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+    
+    def _on_refresh_done(self, task: asyncio.Task):
+        """Record the outcome of a refresh so background failures are not lost"""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            self.last_refresh_error = None
+        else:
+            self.last_refresh_error = getattr(error, "detail", None) or str(error)
+    
+    def cancel_refresh(self):
+        """Cancel an in-flight background refresh (used on shutdown)"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+    
+    async def _refresh_member_data(self) -> Dict[str, Any]:
+        """Download member data from the API and update the cache"""
+        # Fail fast while the member API is known to be down
+        if not member_api_breaker.allow():
+            raise HTTPException(status_code=503, detail="Member data API temporarily unavailable")
+        
+        try:
+            data = None
+            if self.incremental_sync_due():
+                delta = await self._fetch_new_items()
+                if delta is not None:
+                    data = self._apply_new_items(*delta)
+            if data is None:
+                data = await self._full_sync()
+            
+        except HTTPException:
+            raise
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="API timeout - please try again later")
+        except httpx.RequestError:
+            raise HTTPException(status_code=502, detail="Unable to connect to member data API")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch member data: {str(e)}")
+        
+        return data
+    
+    async def load_member_records(self, member_data: Any):
+        """Build the rule-based member records off the event loop if the snapshot has none yet
+        
+        Concurrent callers for the same snapshot share one build.
+        """
+        derived = self._derived_store(member_data)
+        if derived is None or "member_records" in derived:
+            return
+        if self._records_build is None or self._records_build[0] is not member_data:
+            self._records_build = (member_data, asyncio.ensure_future(
+                rule_analyzer.process_member_data_async(member_data)
+            ))
+        task = self._records_build[1]
+        try:
+            records = await asyncio.shield(task)
+        except Exception:
+            return  # answer_locally builds them itself
+        finally:
+            if self._records_build is not None and self._records_build[1] is task and task.done():
+                self._records_build = None
+        self.get_derived("member_records", member_data, lambda data: records)
+    
+    async def _get_messages(self, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """GET /messages, recording the outcome on the member API circuit breaker"""
+        client = self.get_member_api_client()
+        try:
+            response = await client.get(f"{API_BASE_URL}/messages", params=params)
+            response.raise_for_status()
+        except Exception as e:
+            self.record_member_api_error(e)
+            raise
+        member_api_breaker.record_success()
+        return response
+    
+    def record_member_api_error(self, error: Exception):
+        """Count an upstream outage against the breaker; other errors are not its fault"""
+        if is_outage_error(error):
+            member_api_breaker.record_failure()
+        else:
+            member_api_breaker.record_success()
+    
+    async def _full_sync(self) -> Dict[str, Any]:
+        """Stream the whole message list and replace the snapshot if it changed
+        
+        Items are parsed chunk by chunk as the body arrives, so only the items
+        themselves (which the snapshot keeps anyway) are held in full. The
+        indexes are built only for a changed payload, on a worker thread.
+        """
+        global member_data_cache, cache_last_updated, cache_generation, cache_content_hash
+        
+        now = datetime.now()
+        content_hash = hashlib.sha256()
+        parser = StreamingItemsParser()
+        items: List[Any] = []
+        
+        client = self.get_member_api_client()
+        try:
+            async with client.stream("GET", f"{API_BASE_URL}/messages") as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    content_hash.update(chunk)
+                    items.extend(parser.feed(chunk))
+                items.extend(parser.feed(b"", final=True))
+        except Exception as e:
+            self.record_member_api_error(e)
+            raise
+        member_api_breaker.record_success()
+        self.last_full_sync = now
+        
+        # Unchanged payload: keep the current snapshot and everything derived from it
+        if content_hash.hexdigest() == cache_content_hash and member_data_cache:
+            cache_last_updated = now
+            return member_data_cache
+        
+        data = items if parser.top_level_list else {**parser.fields, "items": items}
+        loop = asyncio.get_running_loop()
+        indexes = await loop.run_in_executor(None, self._build_indexes, data)
+        if HYBRID_MODE != "ai":
+            # Ready before the snapshot is published, so local answers never build them on the loop
+            try:
+                indexes["member_records"] = await rule_analyzer.process_member_data_async(data)
+            except Exception:
+                pass  # load_member_records retries on first use
+        
+        # Store raw data for AI processing
+        member_data_cache = data
+        cache_last_updated = now
+        cache_content_hash = content_hash.hexdigest()
+        cache_generation += 1
+        self.reset_sync_state(data)
+        
+        # The indexes built above belong to the new generation
+        self.retire_derived()
+        self._derived = indexes
+        self._derived_generation = cache_generation
+        self._derived_source = data
+        
+        # Answers built from the previous snapshot are no longer valid
+        answer_cache.clear()
+        semantic_cache.clear()
+        
+        return data
+    
+    def _build_indexes(self, data: Any) -> Dict[str, Any]:
+        """The incrementally updatable indexes for a new snapshot"""
+        return {
+            "message_index": MessageIndex.from_member_data(data),
+            "message_stats": MessageStats.from_member_data(data),
+            "member_summaries": MemberSummaryIndex.from_member_data(data)
+        }
+    
+    def reset_sync_state(self, data: Any):
+        """Remember where the upstream list ends after a full download"""
+        items = data.get("items") if isinstance(data, dict) else None
+        if CACHE_SYNC_MODE != "incremental" or not isinstance(items, list) or not items:
+            self.sync_state = None
+            return
+        ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+        self.sync_state = {
+            "count": len(items),
+            "first_id": ids[0],
+            "last_id": ids[-1],
+            "ids": set(ids),
+            "newest_timestamp": max(
+                (item.get("timestamp", "") for item in items if isinstance(item, dict)), default=""
+            ),
+            "paging_supported": (self.sync_state or {}).get("paging_supported", True)
+        }
+    
+    def incremental_sync_due(self) -> bool:
+        """Whether the next refresh can fetch only new messages"""
+        if self.sync_state is None or not self.sync_state["paging_supported"]:
+            return False
+        if None in (self.sync_state["first_id"], self.sync_state["last_id"]):
+            return False
+        return (datetime.now() - self.last_full_sync).total_seconds() < CACHE_FULL_RESYNC_SECONDS
+    
+    async def _fetch_new_items(self) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """Page in the messages after the last known one
+        
+        Returns (new_items, total), or None when a full resync is needed because
+        the upstream list shrank, was reordered or ignores or rejects skip/limit.
+        """
+        state = self.sync_state
+        known = state["count"]
+        new_items: List[Dict[str, Any]] = []
+        # Overlap by one message to check that the list only grew at the end
+        skip = known - 1
+        
+        while True:
+            try:
+                response = await self._get_messages({"skip": skip, "limit": CACHE_SYNC_PAGE_SIZE})
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if not 400 <= status < 500 or status in RETRYABLE_STATUS_CODES:
+                    raise
+                # Paging parameters are rejected (e.g. 422 for a limit above the
+                # API's maximum) - stop trying until restart
+                state["paging_supported"] = False
+                return None
+            page = response.json()
+            items = page.get("items") if isinstance(page, dict) else None
+            total = page.get("total") if isinstance(page, dict) else None
+            if not isinstance(items, list) or not isinstance(total, int) or total < known:
+                return None
+            if len(items) > CACHE_SYNC_PAGE_SIZE or (known > 1 and items and items[0].get("id") == state["first_id"]):
+                # Paging parameters are ignored - stop trying until restart
+                state["paging_supported"] = False
+                return None
+            
+            if skip == known - 1:
+                if not items or items[0].get("id") != state["last_id"]:
+                    return None
+                items = items[1:]
+            if any(item.get("id") in state["ids"] for item in items):
+                return None
+            
+            new_items.extend(items)
+            skip = known + len(new_items)
+            if not items or skip >= total:
+                return new_items, total
+    
+    def _apply_new_items(self, new_items: List[Dict[str, Any]], total: int) -> Dict[str, Any]:
+        """Append newly synced messages to the snapshot and its indexes"""
+        global member_data_cache, cache_last_updated, cache_generation, cache_content_hash
+        
+        cache_last_updated = datetime.now()
+        if not new_items:
+            return member_data_cache
+        
+        # A new snapshot object, so requests still reading the old one are unaffected
+        member_data_cache = {**member_data_cache, "total": total, "items": member_data_cache["items"] + new_items}
+        cache_content_hash = None
+        cache_generation += 1
+        
+        state = self.sync_state
+        state["count"] += len(new_items)
+        state["last_id"] = new_items[-1].get("id")
+        state["ids"].update(item.get("id") for item in new_items)
+        state["newest_timestamp"] = max(
+            [state["newest_timestamp"]] + [item.get("timestamp", "") for item in new_items]
+        )
+        
+        self.extend_derived(cache_generation - 1, new_items)
+        answer_cache.clear()
+        semantic_cache.clear()
+        
+        return member_data_cache
+    
+    def extend_derived(self, previous_generation: int, new_items: List[Dict[str, Any]]):
+        """Carry the incrementally updatable derived values over to the current generation"""
+        if self._derived_generation == previous_generation:
+            valid_items, _ = get_message_items(new_items)
+            previous = self._derived
+            carried = {
+                key: value for key, value in previous.items()
+                if isinstance(value, (MessageIndex, MessageStats, MemberSummaryIndex))
+            }
+            # The carried indexes and member records are extended in place, so
+            # they leave the old snapshot
+            self.retire_derived(list(carried) + ["member_records"])
+            for value in carried.values():
+                value.extend(valid_items)
+            if "member_records" in previous:
+                carried["member_records"] = rule_analyzer.extend_member_data(previous["member_records"], valid_items)
+            
+            # Values for members without new messages stay valid as they are
+            new_members = {item["user_name"] for item in valid_items}
+            if "messages_by_member" in previous:
+                carried["messages_by_member"] = self._regroup_members(previous["messages_by_member"], valid_items)
+            known_members = previous.get("messages_by_member") or previous.get("member_records") or {}
+            if "member_name_index" in previous and new_members <= known_members.keys():
+                carried["member_name_index"] = previous["member_name_index"]
+            for key, value in previous.items():
+                if key.startswith("member_context:") and new_members.isdisjoint(key.split(":", 1)[1].split("|")):
+                    carried[key] = value
+            self._derived = carried
+        else:
+            self.retire_derived()
+            self._derived = {}
+        self._derived_generation = cache_generation
+        self._derived_source = member_data_cache
+    
+    def retire_derived(self, carried: Collection[str] = ()):
+        """Keep the outgoing snapshot's derived values, except those carried over to the new one"""
+        if self._derived_source is not None:
+            self._previous_source = self._derived_source
+            self._previous_derived = {
+                key: value for key, value in self._derived.items() if key not in carried
+            }
+    
+    def sync_stats(self) -> Dict[str, Any]:
+        return {
+            "mode": CACHE_SYNC_MODE,
+            "paging_supported": self.sync_state["paging_supported"] if self.sync_state else None,
+            "known_messages": self.sync_state["count"] if self.sync_state else None,
+            "newest_timestamp": self.sync_state["newest_timestamp"] if self.sync_state else None,
+            "last_full_sync": self.last_full_sync.isoformat() if self.last_full_sync else None
+        }
     
-    async def fetch_member_data(self) -> Dict[str, Any]:
-        """Fetch member data from the API with caching"""
-        global member_data_cache, cache_last_updated
-        
-        # Check if cache is still valid
-        now = datetime.now()
-        if (cache_last_updated and 
-            (now - cache_last_updated).total_seconds() < CACHE_DURATION_MINUTES * 60 and
-            member_data_cache):
-            return member_data_cache
+    def _derived_store(self, member_data: Any) -> Optional[Dict[str, Any]]:
+        """The derived values kept for a snapshot, or None if it is neither the cached one nor the one it replaced"""
+        if member_data is member_data_cache:
+            if self._derived_generation != cache_generation:
+                self.retire_derived()
+                self._derived = {}
+                self._derived_generation = cache_generation
+                self._derived_source = member_data
+            return self._derived
+        if member_data is self._previous_source:
+            return self._previous_derived
+        return None
+    
+    def get_derived(self, key: str, member_data: Any, builder) -> Any:
+        """Return builder(member_data), built at most once per snapshot"""
+        derived = self._derived_store(member_data)
+        if derived is None:
+            return builder(member_data)
         
-        try:
-            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                response = await client.get(f"{API_BASE_URL}/messages")
-                response.raise_for_status()
-                data = response.json()
-                
-                # Store raw data for AI processing
-                member_data_cache = data
-                cache_last_updated = now
-                
-                return data
-                
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=504, detail="API timeout - please try again later")
-        except httpx.RequestError:
-            raise HTTPException(status_code=502, detail="Unable to connect to member data API")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to fetch member data: {str(e)}")
+        if key not in derived:
+            derived[key] = builder(member_data)
+        return derived[key]
     
     def prepare_context_for_ai(self, member_data: Any) -> str:
         """Convert member data into a properly formatted context string for AI"""
-        # Handle the actual API structure: {"total": 3349, "items": [...]}
-        items = []
-        if isinstance(member_data, dict) and "items" in member_data:
-            items = member_data["items"]
-            total_count = member_data.get("total", len(items))
-        elif isinstance(member_data, list):
-            items = member_data
-            total_count = len(items)
-        else:
-            return "No valid member data available."
+        return self.get_global_context(member_data)["context"]
+    
+    def get_global_context(self, member_data: Any) -> Dict[str, Any]:
+        """Global overview context and its token count, built once per generation"""
+        return self.get_derived("global_context", member_data, self._build_global_context)
+    
+    def _build_global_context(self, member_data: Any) -> Dict[str, Any]:
+        """Pack every member's most recent messages into the token budget"""
+        if not (isinstance(member_data, list) or
+                (isinstance(member_data, dict) and "items" in member_data)):
+            context = "No valid member data available."
+            return {"context": context, "context_tokens": count_tokens(context), "messages_included": 0}
+        _, total_count = get_message_items(member_data)
+        members_data = self.get_messages_by_member(member_data)
+        
+        # Reserve room for each member's "... and N more messages" note
+        builder = ContextBuilder(
+            [f"Member Data System - {total_count} total messages", "=" * 50],
+            CONTEXT_TOKEN_BUDGET - 12 * len(members_data)
+        )
         
-        context_parts = []
-        context_parts.append(f"Member Data System - {total_count} total messages")
-        context_parts.append("=" * 50)
+        # Round-robin across members so every member is represented before
+        # anyone gets a second message; stop once the budget is exhausted
+        depth = 0
+        remaining = list(members_data.items())
+        while remaining:
+            next_round = []
+            for member_name, messages in remaining:
+                item = messages[depth]
+                if not builder.add(member_name, item["message"], item.get("timestamp", "")):
+                    next_round = []
+                    break
+                if depth + 1 < len(messages):
+                    next_round.append((member_name, messages))
+            else:
+                depth += 1
+                remaining = next_round
+                continue
+            break
         
-        # Group messages by member
-        members_data = {}
+        omitted = {
+            member_name: len(messages) - len(builder.members.get(member_name, []))
+            for member_name, messages in members_data.items()
+        }
+        context = builder.render(omitted)
+        return {
+            "context": context,
+            "context_tokens": count_tokens(context),
+            "messages_included": builder.messages_included
+        }
+    
+    def get_messages_by_member(self, member_data: Any) -> Dict[str, List[Dict[str, Any]]]:
+        """Each member's messages, newest first, grouped once per generation"""
+        return self.get_derived("messages_by_member", member_data, self._group_messages_by_member)
+    
+    def _group_messages_by_member(self, member_data: Any) -> Dict[str, List[Dict[str, Any]]]:
+        items, _ = get_message_items(member_data)
+        members_data: Dict[str, List[Dict[str, Any]]] = {}
         for item in items:
-            if isinstance(item, dict) and "user_name" in item and "message" in item:
-                user_name = item["user_name"]
-                if user_name not in members_data:
-                    members_data[user_name] = []
-                
-                members_data[user_name].append({
-                    "message": item["message"],
-                    "timestamp": item.get("timestamp", ""),
-                    "id": item.get("id", "")
-                })
-        
-        # Format for AI consumption
-        for member_name, messages in members_data.items():
-            context_parts.append(f"\nMEMBER: {member_name}")
-            context_parts.append("-" * 30)
-            
-            for i, msg_data in enumerate(messages[:10]):  # Limit to avoid token limits
-                timestamp = msg_data["timestamp"][:10] if msg_data["timestamp"] else "Unknown date"
-                context_parts.append(f"[{timestamp}] {msg_data['message']}")
-            
-            if len(messages) > 10:
-                context_parts.append(f"... and {len(messages) - 10} more messages")
-            
-            context_parts.append("")  # Add spacing
+            members_data.setdefault(item["user_name"], []).append(item)
+        for messages in members_data.values():
+            messages.sort(key=lambda item: item.get("timestamp", ""), reverse=True)
+        return members_data
+    
+    def _regroup_members(self, members_data: Dict[str, List[Dict[str, Any]]],
+                         new_items: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """A copy of the per-member grouping with new messages merged in, newest first"""
+        regrouped = dict(members_data)
+        added: Dict[str, List[Dict[str, Any]]] = {}
+        for item in new_items:
+            added.setdefault(item["user_name"], []).append(item)
+        for member, items in added.items():
+            # Ties keep message order, as in _group_messages_by_member
+            messages = regrouped.get(member, []) + items
+            messages.sort(key=lambda item: item.get("timestamp", ""), reverse=True)
+            regrouped[member] = messages
+        return regrouped
+    
+    def _build_member_context(self, member_data: Any, members: List[str]) -> Optional[Dict[str, Any]]:
+        """Context with only the given members' messages, all of them if they fit
         
-        return "\n".join(context_parts)
+        Returns None when they do not fit and retrieval can pick the relevant
+        ones instead; without retrieval the newest messages are kept.
+        """
+        members_data = self.get_messages_by_member(member_data)
+        builder = ContextBuilder(
+            [f"Member Data System - all messages from {', '.join(members)}", "=" * 50],
+            MEMBER_CONTEXT_TOKEN_BUDGET - 12 * len(members)
+        )
+        
+        # Newest first, alternating between members, until the budget runs out
+        queues = [deque(members_data.get(member, [])) for member in members]
+        complete = True
+        while complete and any(queues):
+            for member, queue in zip(members, queues):
+                if queue:
+                    item = queue.popleft()
+                    if not builder.add(member, item["message"], item.get("timestamp", "")):
+                        complete = False
+                        break
+        if not complete and RETRIEVAL_ENABLED:
+            return None
+        
+        omitted = {
+            member: len(members_data.get(member, [])) - len(builder.members.get(member, []))
+            for member in members
+        }
+        context = builder.render(omitted)
+        return {
+            "context": context,
+            "context_tokens": count_tokens(context),
+            "strategy": "member",
+            "messages_included": builder.messages_included,
+            "members_included": len(builder.members)
+        }
     
-    async def ask_ai(self, question: str, context: str) -> Dict[str, Any]:
-        """Send question and context to AI for processing"""
+    def estimate_context(self, question: str, member_data: Any) -> Tuple[str, int]:
+        """The context strategy build_question_context will pick and its approximate tokens
+        
+        Sized from message counts and the mean tokens per message instead of
+        packing the context.
+        """
+        mentioned = self.mentioned_members(question, member_data)
+        per_message = self.get_derived("mean_message_tokens", member_data, self._mean_message_tokens)
+        members_data = self.get_messages_by_member(member_data)
+        if MEMBER_CONTEXT_ENABLED and 0 < len(mentioned) <= MEMBER_CONTEXT_MAX_MEMBERS:
+            tokens = int(per_message * sum(len(members_data.get(member, [])) for member in mentioned))
+            tokens += MEMBER_SECTION_TOKENS * len(mentioned)
+            if tokens <= MEMBER_CONTEXT_TOKEN_BUDGET or not RETRIEVAL_ENABLED:
+                return "member", min(tokens, MEMBER_CONTEXT_TOKEN_BUDGET)
+        
+        if RETRIEVAL_ENABLED:
+            # Member names are indexed with their messages, so named members always match
+            index = self.get_derived("message_index", member_data, MessageIndex.from_member_data)
+            matches = RETRIEVAL_TOP_K if mentioned else index.match_count(question)
+            if matches:
+                messages = min(matches, RETRIEVAL_TOP_K)
+                tokens = int(per_message * messages) + MEMBER_SECTION_TOKENS * min(messages, len(members_data))
+                return "retrieval", min(tokens, CONTEXT_TOKEN_BUDGET)
+        
+        return "global", self.get_global_context(member_data)["context_tokens"]
+    
+    def _mean_message_tokens(self, member_data: Any) -> float:
+        """Mean context tokens per message over an even sample of at most ~200 messages"""
+        items, _ = get_message_items(member_data)
+        if not items:
+            return 0.0
+        sample = items[::max(1, len(items) // 200)]
+        return sum(
+            count_tokens(f"[{item.get('timestamp', '')[:10]}] {item['message']}") + 1 for item in sample
+        ) / len(sample)
+    
+    def build_question_context(self, question: str, member_data: Any) -> Dict[str, Any]:
+        """Build a compact context from the messages most relevant to the question
+        
+        Questions about a few named members get just those members' messages;
+        aggregation and comparison questions also get precomputed statistics.
+        """
+        mentioned = self.mentioned_members(question, member_data)
+        context_info = None
+        if MEMBER_CONTEXT_ENABLED and 0 < len(mentioned) <= MEMBER_CONTEXT_MAX_MEMBERS:
+            members = sorted(mentioned)
+            context_info = self.get_derived(
+                "member_context:" + "|".join(members), member_data,
+                lambda data: self._build_member_context(data, members)
+            )
+        if context_info is None:
+            context_info = self._build_retrieval_context(question, member_data)
+        
+        if classify_question(question, len(mentioned)) != "lookup":
+            stats = self.get_derived("message_stats", member_data, MessageStats.from_member_data)
+            context = stats.facts(mentioned) + "\n\n" + context_info["context"]
+            context_info = {**context_info, "context": context, "context_tokens": count_tokens(context)}
+        
+        return context_info
+    
+    def _build_retrieval_context(self, question: str, member_data: Any) -> Dict[str, Any]:
+        """Pack the messages most relevant to the question, or the global overview"""
+        if RETRIEVAL_ENABLED:
+            index = self.get_derived("message_index", member_data, MessageIndex.from_member_data)
+            # Questions about named members only retrieve those members' messages,
+            # with an equal share each so one name cannot crowd out the others
+            mentioned = self.mentioned_members(question, member_data)
+            if mentioned:
+                share = max(1, RETRIEVAL_TOP_K // len(mentioned))
+                hits = sorted(
+                    (hit for member in mentioned for hit in index.search(question, share, frozenset([member]))),
+                    key=lambda hit: hit[0], reverse=True
+                )
+            else:
+                hits = index.search(question, RETRIEVAL_TOP_K)
+        else:
+            hits = []
+        
+        # Nothing matched (or retrieval disabled) - fall back to the global overview
+        if not hits:
+            global_context = self.get_global_context(member_data)
+            return {
+                "context": global_context["context"],
+                "context_tokens": global_context["context_tokens"],
+                "strategy": "global",
+                "messages_included": global_context["messages_included"],
+                "members_included": None
+            }
+        
+        _, total_count = get_message_items(member_data)
+        builder = ContextBuilder(
+            [
+                f"Member Data System - {total_count} total messages",
+                "Showing the messages most relevant to the question",
+                "=" * 50
+            ],
+            CONTEXT_TOKEN_BUDGET
+        )
+        
+        # Pack hits in relevance order until the token budget is spent
+        for _, item in hits:
+            if not builder.add(item["user_name"], item["message"], item.get("timestamp", "")):
+                break
+        
+        context = builder.render()
+        return {
+            "context": context,
+            "context_tokens": count_tokens(context),
+            "strategy": "retrieval",
+            "messages_included": builder.messages_included,
+            "members_included": len(builder.members)
+        }
+    
+    def check_ai_configured(self):
+        """Raise if no OpenAI API key is configured"""
         if not OPENAI_API_KEY:
             raise HTTPException(
                 status_code=500, 
                 detail="AI service not configured. Please set OPENAI_API_KEY environment variable."
             )
-        
-        # Create a comprehensive prompt for the AI
-        system_prompt = """You are a precise data analyst for a luxury concierge service. Your job is to extract and report specific information from member service requests.
-
-ANALYSIS RULES:
-1. Answer ONLY with information explicitly stated in the member messages
-2. Quote specific dates, locations, restaurant names, and request details exactly as written
-3. If asked about preferences, extract them word-for-word from the messages
-4. For "how many" questions, count actual occurrences in the data
-5. For comparison questions, analyze all relevant members' data
-6. If information doesn't exist in the messages, state: "No information available in the data"
-
-RESPONSE FORMAT:
-- Give direct, factual answers without speculation
-- Include specific dates, numbers, and names when available
-- Use bullet points or numbered lists for multiple items
-- Cite member names exactly as they appear in the data
-- For trends/patterns, only mention what can be directly observed
-
-WHAT TO EXTRACT:
-- Restaurant reservations (name, date, party size)
-- Travel requests (destinations, dates, accommodation types)
-- Event tickets (venue, event type, quantity, dates)
-- Personal preferences (exact wording from messages)
-- Service feedback (positive/negative, specific comments)
-- Contact updates (phone numbers, addresses)
-- Special requirements (dietary, accessibility, room preferences)
-
-DO NOT:
-- Make assumptions beyond what's explicitly stated
-- Generalize from limited data
-- Add interpretive language like "seems to prefer" - use "requested" or "stated preference for"
-- Include information not present in the member messages"""
-
+    
+    def build_ai_payload(self, question: str, context: str, model: str = AI_MODEL) -> Dict[str, Any]:
+        """Build the chat completion request for a question and its context"""
         user_prompt = f"""Member Service Data:
 {context}
 
@@ -175,50 +1998,428 @@ Question: {question}
 
 Please analyze the member messages above and answer the question. Focus on extracting relevant information from the actual messages and requests made by the members."""
 
-        payload = {
-            "model": AI_MODEL,
+        return {
+            "model": model,
             "messages": [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ],
             "max_tokens": 800,
             "temperature": 0.5,  # Lower temperature for more focused responses
         }
+    
+    def check_llm_breaker(self):
+        """Fail fast while the AI provider is known to be down"""
+        if not llm_breaker.allow():
+            raise HTTPException(status_code=503, detail="AI service temporarily unavailable")
+    
+    def record_llm_error(self, e: Exception):
+        """Count provider outages against the breaker; other errors mean it answered"""
+        if is_outage_error(e):
+            llm_breaker.record_failure()
+        else:
+            llm_breaker.record_success()
+    
+    def estimate_request_tokens(self, payload: Dict[str, Any]) -> int:
+        """Worst-case tokens for a request: the prompt plus the completion limit"""
+        prompt_tokens = sum(count_tokens(message["content"]) + 4 for message in payload["messages"])
+        return prompt_tokens + payload.get("max_tokens", 0)
+    
+    def ai_status_error(self, e: httpx.HTTPStatusError) -> HTTPException:
+        """Map an OpenAI HTTP error to the error returned to the client"""
+        if e.response.status_code == 401:
+            return HTTPException(status_code=500, detail="AI service authentication failed")
+        elif e.response.status_code == 429:
+            return HTTPException(status_code=503, detail="AI service rate limit exceeded")
+        else:
+            return HTTPException(status_code=500, detail=f"AI service error: {e.response.status_code}")
+    
+    async def ask_ai(self, question: str, context: str, model: str = AI_MODEL) -> Dict[str, Any]:
+        """Send question and context to AI for processing"""
+        self.check_ai_configured()
+        
+        # Hedging needs the first-chunk signal, so go through the streaming path
+        if hedging_policy.enabled:
+            async for event in self.stream_ai(question, context, model):
+                if event["type"] == "done":
+                    return {key: value for key, value in event.items() if key != "type"}
+        
+        payload = self.build_ai_payload(question, context, model)
+        estimated_tokens = self.estimate_request_tokens(payload)
+        deadline = time.monotonic() + AI_REQUEST_DEADLINE_SECONDS
         
         try:
-            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                response = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=self.openai_headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                result = response.json()
+            client = self.get_openai_client()
+            attempt = 0
+            while True:
+                attempt += 1
+                self.check_llm_breaker()
+                await rate_limiter.acquire(estimated_tokens)
+                try:
+                    response = await client.post(
+                        OPENAI_API_URL,
+                        headers=self.openai_headers,
+                        json=payload,
+                        timeout=min(30.0, max(1.0, deadline - time.monotonic()))
+                    )
+                    response.raise_for_status()
+                    llm_breaker.record_success()
+                    break
+                except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                    self.record_llm_error(e)
+                    delay = retry_delay(e, attempt)
+                    if (delay is None or attempt > AI_MAX_RETRIES or
+                            time.monotonic() + delay >= deadline):
+                        raise
+                    await asyncio.sleep(delay)
+            
+            result = response.json()
+            rate_limiter.record_usage(estimated_tokens, result.get("usage") or {})
+            
+            if "choices" in result and len(result["choices"]) > 0:
+                answer = result["choices"][0]["message"]["content"].strip()
                 
-                if "choices" in result and len(result["choices"]) > 0:
-                    answer = result["choices"][0]["message"]["content"].strip()
-                    
-                    # Try to estimate confidence based on the response
-                    confidence = self.estimate_confidence(answer)
-                    
-                    return {
-                        "answer": answer,
-                        "confidence": confidence,
-                        "usage": result.get("usage", {}),
-                        "model_used": AI_MODEL
-                    }
-                else:
-                    raise HTTPException(status_code=500, detail="Invalid response from AI service")
-                    
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 401:
-                raise HTTPException(status_code=500, detail="AI service authentication failed")
-            elif e.response.status_code == 429:
-                raise HTTPException(status_code=503, detail="AI service rate limit exceeded")
+                # Try to estimate confidence based on the response
+                confidence = self.estimate_confidence(answer)
+                
+                return {
+                    "answer": answer,
+                    "confidence": confidence,
+                    "usage": result.get("usage", {}),
+                    "model_used": model,
+                    "attempts": attempt
+                }
             else:
-                raise HTTPException(status_code=500, detail=f"AI service error: {e.response.status_code}")
+                raise HTTPException(status_code=500, detail="Invalid response from AI service")
+                
+        except HTTPException:
+            raise
+        except httpx.HTTPStatusError as e:
+            raise self.ai_status_error(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error calling AI service: {str(e)}")
+    
+    async def stream_ai(self, question: str, context: str, model: str = AI_MODEL) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the AI answer as it is generated
+        
+        Yields {"type": "token", "content": ...} for each text delta and a final
+        {"type": "done", ...} event carrying the full answer, confidence and usage.
+        Failures are retried only until the first token has been sent.
+        """
+        self.check_ai_configured()
+        payload = self.build_ai_payload(question, context, model)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        estimated_tokens = self.estimate_request_tokens(payload)
+        deadline = time.monotonic() + AI_REQUEST_DEADLINE_SECONDS
+        
+        answer_parts = []
+        usage = {}
+        attempt = 0
+        try:
+            client = self.get_openai_client()
+            while True:
+                attempt += 1
+                self.check_llm_breaker()
+                await rate_limiter.acquire(estimated_tokens)
+                try:
+                    first_chunk, chunks = await self._start_completion_stream(
+                        client,
+                        payload,
+                        min(30.0, max(1.0, deadline - time.monotonic())),
+                        estimated_tokens
+                    )
+                    try:
+                        chunk = first_chunk
+                        while chunk is not None:
+                            if chunk.get("usage"):
+                                usage = chunk["usage"]
+                            for choice in chunk.get("choices") or []:
+                                delta = (choice.get("delta") or {}).get("content")
+                                if delta:
+                                    answer_parts.append(delta)
+                                    yield {"type": "token", "content": delta}
+                            chunk = await anext_or_none(chunks)
+                    finally:
+                        await chunks.aclose()
+                    break
+                except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                    self.record_llm_error(e)
+                    # Once tokens have been sent the answer cannot be restarted
+                    delay = None if answer_parts else retry_delay(e, attempt)
+                    if (delay is None or attempt > AI_MAX_RETRIES or
+                            time.monotonic() + delay >= deadline):
+                        raise
+                    await asyncio.sleep(delay)
+        
+        except HTTPException:
+            raise
+        except httpx.HTTPStatusError as e:
+            raise self.ai_status_error(e)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error calling AI service: {str(e)}")
+        
+        rate_limiter.record_usage(estimated_tokens, usage)
+        answer = "".join(answer_parts).strip()
+        yield {
+            "type": "done",
+            "answer": answer,
+            "confidence": self.estimate_confidence(answer),
+            "usage": usage,
+            "model_used": model,
+            "attempts": attempt
+        }
+    
+    async def _completion_chunks(self, client: httpx.AsyncClient, payload: Dict[str, Any],
+                                 timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        """Send one streaming completion request and yield its parsed chunks"""
+        async with client.stream(
+            "POST",
+            OPENAI_API_URL,
+            headers=self.openai_headers,
+            json=payload,
+            timeout=timeout
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            llm_breaker.record_success()
+            
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data)
+    
+    async def _start_completion_stream(self, client: httpx.AsyncClient, payload: Dict[str, Any],
+                                       timeout: float, estimated_tokens: int
+                                       ) -> Tuple[Optional[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]:
+        """Open a completion stream and wait for its first chunk, hedging if it is slow
+        
+        Returns the first chunk (None for an empty stream) and the stream to
+        continue reading from. When a hedge fires, the slower request is cancelled.
+        """
+        hedging_policy.requests += 1
+        started = time.monotonic()
+        primary = self._completion_chunks(client, payload, timeout)
+        primary_task = asyncio.ensure_future(anext_or_none(primary))
+        contenders = {primary_task: (primary, started)}
+        
+        if hedging_policy.enabled:
+            await asyncio.wait({primary_task}, timeout=hedging_policy.delay())
+            if (not primary_task.done() and hedging_policy.allow_hedge() and
+                    llm_breaker.state == "closed" and rate_limiter.try_acquire(estimated_tokens)):
+                hedging_policy.hedges += 1
+                hedge = self._completion_chunks(client, payload, timeout)
+                hedge_task = asyncio.ensure_future(anext_or_none(hedge))
+                contenders[hedge_task] = (hedge, time.monotonic())
+        
+        pending = set(contenders)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        # A failed contender only matters if the other one fails too
+                        error = task.exception()
+                        continue
+                    
+                    stream, stream_started = contenders[task]
+                    hedging_policy.observe(time.monotonic() - stream_started)
+                    if task is not primary_task:
+                        hedging_policy.hedge_wins += 1
+                    
+                    # Cancel and close the loser
+                    for other, (other_stream, _) in contenders.items():
+                        if other is not task:
+                            other.cancel()
+                            await asyncio.gather(other, return_exceptions=True)
+                            await other_stream.aclose()
+                    return task.result(), stream
+        except asyncio.CancelledError:
+            for task, (stream, _) in contenders.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+            raise
+        
+        # Every contender failed
+        raise error
+    
+    def mentioned_members(self, question: str, member_data: Any) -> frozenset:
+        """Members named in the question by full, first or last name"""
+        return self.get_name_index(member_data).mentioned(question)
+    
+    def get_name_index(self, member_data: Any) -> MemberNameIndex:
+        """Member name index over the user names in the data, built once per generation"""
+        return self.get_derived(
+            "member_name_index", member_data,
+            lambda data: MemberNameIndex(item["user_name"] for item in get_message_items(data)[0])
+        )
+    
+    def lookup_cached_answer(self, question: str, model: str, member_data: Any,
+                             generation: int) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Look a question up in the exact, then the semantic answer cache"""
+        if ANSWER_CACHE_ENABLED:
+            cached = answer_cache.get(answer_cache.make_key(question, model, generation))
+            if cached is not None:
+                return cached, "hit"
+        
+        if SEMANTIC_CACHE_ENABLED:
+            members = self.mentioned_members(question, member_data)
+            cached = semantic_cache.lookup(question, model, generation, members)
+            if cached is not None:
+                return cached, "semantic_hit"
+        
+        return None, "miss"
+    
+    def store_answer(self, question: str, model: str, member_data: Any, generation: int,
+                     result: Dict[str, Any]):
+        """Store a fresh answer in the answer caches"""
+        if ANSWER_CACHE_ENABLED:
+            answer_cache.set(answer_cache.make_key(question, model, generation), result)
+        if SEMANTIC_CACHE_ENABLED:
+            members = self.mentioned_members(question, member_data)
+            semantic_cache.add(question, model, generation, members, result)
+    
+    def route_model(self, question: str, member_data: Any) -> Tuple[str, str]:
+        """Pick the model for a question; returns (model, question_type)
+        
+        Uses the estimated context size, so the answer cache can be checked
+        before the context is built.
+        """
+        question_type = classify_question(question, len(self.mentioned_members(question, member_data)))
+        strategy, context_tokens = self.estimate_context(question, member_data)
+        large_context = strategy != "member" and context_tokens > ROUTER_LARGE_CONTEXT_TOKENS
+        if not MODEL_ROUTING_ENABLED or large_context:
+            return AI_MODEL, question_type
+        return MODEL_ROUTES.get(question_type, AI_MODEL), question_type
+    
+    def answer_locally(self, question: str, member_data: Any) -> Dict[str, Any]:
+        """Answer with the rule-based extractor and estimate how reliable that is"""
+        records = self.get_derived("member_records", member_data, rule_analyzer.process_member_data)
+        mentioned = self.mentioned_members(question, member_data)
+        
+        # Resolve the member with the name index; the rules' fuzzy matcher is a fallback
+        target = next(iter(mentioned)) if len(mentioned) == 1 else None
+        details = rule_analyzer.search_member_data_detailed(question, records, target)
+        
+        # Only single-member "what/where" lookups with extracted facts are trustworthy;
+        # the rules cannot answer when/who/how-many questions
+        if not details["member"] or not details["facts_found"] or details["category"] == "general":
+            confidence = 0.2
+        elif details["member"] not in mentioned:
+            confidence = 0.3  # Fuzzy match the name index does not back up
+        elif len(mentioned) > 1 or classify_question(question) != "lookup" or question_intent(question):
+            confidence = 0.4
+        elif not rule_answer_covers(question, details["member"], details["category"]):
+            confidence = 0.5  # Asks about something specific the category's fact list ignores
+        elif not rule_facts_complete(details):
+            confidence = 0.6  # The answer leaves facts out or lists extraction noise
+        elif details["member"].lower() in question.lower():
+            confidence = 0.9
+        else:
+            confidence = 0.8  # Named by first or last name only
+        
+        return {**details, "confidence": confidence}
+    
+    def answer_with_statistics(self, question: str, member_data: Any) -> Optional[str]:
+        """Answer counting and ranking questions exactly from the message statistics"""
+        query = parse_stats_query(question, self.mentioned_members(question, member_data))
+        if query is None:
+            return None
+        stats = self.get_derived("message_stats", member_data, MessageStats.from_member_data)
+        return stats.answer(query)
+    
+    def try_local_answer(self, question: str, member_data: Any, generation: int,
+                         mode: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The local answer for a question, or None if it should go to the AI"""
+        mode = mode or HYBRID_MODE
+        if mode == "ai":
+            return None
+        
+        # Statistics are exact, so they are always served when the question parses
+        answer = self.answer_with_statistics(question, member_data)
+        if answer is not None:
+            local = {"answer": answer, "confidence": 0.95, "member": None}
+            model_used, source = "local-analytics", "local_analytics"
+        else:
+            local = self.answer_locally(question, member_data)
+            if mode != "local" and local["confidence"] < LOCAL_ANSWER_MIN_CONFIDENCE:
+                return None
+            model_used, source = "local-rules", "local_rules"
+        
+        answer_path_counts["local"] += 1
+        return {
+            "answer": local["answer"],
+            "confidence": local["confidence"],
+            "usage": {},
+            "model_used": model_used,
+            "attempts": 0,
+            "question_type": classify_question(question),
+            "context_length": 0,
+            "context_tokens": 0,
+            "context_strategy": "local",
+            "messages_included": None,
+            "members_included": 1 if local["member"] else 0,
+            "data_generation": generation,
+            "sources_used": ["member_data_api", source],
+            "answer_path": "local",
+            "cache": "none"
+        }
+    
+    async def answer_question(self, question: str, use_cache: bool = True,
+                              member_data: Any = None, generation: Optional[int] = None,
+                              mode: Optional[str] = None) -> Dict[str, Any]:
+        """Answer a question end to end: local rules, context, routing, answer caches and AI
+        
+        Pass member_data and its generation to reuse one snapshot across questions.
+        """
+        # Fetch member data
+        if member_data is None:
+            member_data = await self.fetch_member_data()
+            generation = cache_generation
+        
+        # Fast path: confident rule-based answers never reach the AI
+        if (mode or HYBRID_MODE) != "ai":
+            await self.load_member_records(member_data)
+        local = self.try_local_answer(question, member_data, generation, mode)
+        if local is not None:
+            return local
+        
+        model, question_type = self.route_model(question, member_data)
+        
+        if use_cache:
+            cached, cache_status = self.lookup_cached_answer(question, model, member_data, generation)
+            if cached is not None:
+                answer_path_counts["cache"] += 1
+                return {**cached, "answer_path": "cache", "cache": cache_status}
+        
+        # Prepare context for AI from the messages relevant to the question
+        context_info = self.build_question_context(question, member_data)
+        context = context_info["context"]
+        
+        # Get AI response
+        ai_response = await self.ask_ai(question, context, model)
+        answer_path_counts["ai"] += 1
+        
+        result = {
+            **ai_response,
+            "question_type": question_type,
+            "context_length": len(context),
+            "context_tokens": context_info["context_tokens"],
+            "context_strategy": context_info["strategy"],
+            "messages_included": context_info["messages_included"],
+            "members_included": context_info["members_included"],
+            "data_generation": generation,
+            "sources_used": ["member_data_api", "ai_processing"]
+        }
+        self.store_answer(question, model, member_data, generation, result)
+        
+        return {**result, "answer_path": "ai", "cache": "miss" if use_cache else "bypass"}
     
     def estimate_confidence(self, answer: str) -> float:
         """Estimate confidence based on response characteristics"""
@@ -260,26 +2461,27 @@ async def root():
         "ai_configured": bool(OPENAI_API_KEY)
     }
 
+def cache_bypass_requested(header_value: Optional[str]) -> bool:
+    """Whether the X-Cache-Bypass request header asks to skip the answer cache"""
+    return bool(header_value) and header_value.lower() in ("1", "true", "yes")
+
 @app.post("/ask", response_model=AnswerResponse)
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, x_cache_bypass: Optional[str] = Header(None)):
     """Main endpoint for asking questions about member data using AI"""
     if not request.question or not request.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
     
     try:
-        # Fetch member data
-        member_data = await ai_qa.fetch_member_data()
-        
-        # Prepare context for AI
-        context = ai_qa.prepare_context_for_ai(member_data)
-        
-        # Get AI response
-        ai_response = await ai_qa.ask_ai(request.question, context)
+        ai_response = await ai_qa.answer_question(
+            request.question,
+            use_cache=not cache_bypass_requested(x_cache_bypass),
+            mode=request.mode
+        )
         
         return AnswerResponse(
             answer=ai_response["answer"],
             confidence=ai_response.get("confidence"),
-            sources_used=["member_data_api", "ai_processing"]
+            sources_used=ai_response["sources_used"]
         )
         
     except HTTPException:
@@ -288,71 +2490,254 @@ async def ask_question(request: QuestionRequest):
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
 
 @app.post("/ask-detailed")
-async def ask_question_detailed(request: QuestionRequest):
+async def ask_question_detailed(request: QuestionRequest, x_cache_bypass: Optional[str] = Header(None)):
     """Extended endpoint with detailed AI response information"""
     if not request.question or not request.question.strip():
         raise HTTPException(status_code=400, detail="Question cannot be empty")
     
     try:
-        # Fetch member data
+        ai_response = await ai_qa.answer_question(
+            request.question,
+            use_cache=not cache_bypass_requested(x_cache_bypass),
+            mode=request.mode
+        )
+        
+        return {
+            "answer": ai_response["answer"],
+            "confidence": ai_response.get("confidence"),
+            "model_used": ai_response.get("model_used"),
+            "question_type": ai_response.get("question_type"),
+            "usage": ai_response.get("usage"),
+            "context_length": ai_response["context_length"],
+            "context_tokens": ai_response["context_tokens"],
+            "context_strategy": ai_response["context_strategy"],
+            "messages_included": ai_response["messages_included"],
+            "members_included": ai_response["members_included"],
+            "data_generation": ai_response["data_generation"],
+            "cache": ai_response["cache"],
+            "attempts": ai_response.get("attempts"),
+            "answer_path": ai_response["answer_path"],
+            "sources_used": ai_response["sources_used"],
+            "timestamp": datetime.now().isoformat()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+
+@app.post("/ask-batch")
+async def ask_question_batch(request: BatchQuestionRequest, x_cache_bypass: Optional[str] = Header(None)):
+    """Answer many questions against one member data snapshot with concurrent AI calls
+    
+    Results come back in request order, each with either an answer or an error.
+    With "stream": true they are sent as NDJSON lines as soon as each finishes.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    
+    try:
+        # Fetch member data once for the whole batch
         member_data = await ai_qa.fetch_member_data()
+        generation = cache_generation
         
-        # Prepare context for AI
-        context = ai_qa.prepare_context_for_ai(member_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing questions: {str(e)}")
+    
+    use_cache = not cache_bypass_requested(x_cache_bypass)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def answer_one(index: int, question: str, mode: Optional[str]) -> Dict[str, Any]:
+        if not question or not question.strip():
+            return {"index": index, "question": question, "error": {"status_code": 400, "detail": "Question cannot be empty"}}
         
-        # Get AI response
-        ai_response = await ai_qa.ask_ai(request.question, context)
+        async with semaphore:
+            try:
+                ai_response = await ai_qa.answer_question(
+                    question, use_cache=use_cache, member_data=member_data, generation=generation, mode=mode
+                )
+            except HTTPException as e:
+                return {"index": index, "question": question, "error": {"status_code": e.status_code, "detail": e.detail}}
+            except Exception as e:
+                return {"index": index, "question": question, "error": {"status_code": 500, "detail": f"Error processing question: {str(e)}"}}
         
         return {
+            "index": index,
+            "question": question,
             "answer": ai_response["answer"],
             "confidence": ai_response.get("confidence"),
             "model_used": ai_response.get("model_used"),
-            "usage": ai_response.get("usage"),
-            "context_length": len(context),
-            "sources_used": ["member_data_api", "ai_processing"],
-            "timestamp": datetime.now().isoformat()
+            "answer_path": ai_response["answer_path"],
+            "cache": ai_response["cache"]
         }
+    
+    tasks = [
+        asyncio.ensure_future(answer_one(index, item.question, item.mode))
+        for index, item in enumerate(request.questions)
+    ]
+    
+    if request.stream:
+        async def result_stream():
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield json.dumps(await finished) + "\n"
+            finally:
+                # Client went away - stop the remaining AI calls
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*tasks)
+    return {
+        "results": results,
+        "total": len(results),
+        "succeeded": sum(1 for result in results if "error" not in result),
+        "failed": sum(1 for result in results if "error" in result),
+        "data_generation": generation,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask-stream")
+async def ask_question_stream(request: QuestionRequest, x_cache_bypass: Optional[str] = Header(None)):
+    """Streaming variant of /ask that sends the answer as Server-Sent Events
+    
+    Emits "token" events as the model generates text, then a trailing "done"
+    event with the full answer and confidence (or an "error" event).
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    use_cache = not cache_bypass_requested(x_cache_bypass)
+    try:
+        # Fetch member data
+        member_data = await ai_qa.fetch_member_data()
+        generation = cache_generation
+        
+        # Confident rule-based answers are sent like cached ones
+        if (request.mode or HYBRID_MODE) != "ai":
+            await ai_qa.load_member_records(member_data)
+        cached = ai_qa.try_local_answer(request.question, member_data, generation, request.mode)
+        cache_status = "none"
+        
+        if cached is None:
+            ai_qa.check_ai_configured()
+            
+            model, question_type = ai_qa.route_model(request.question, member_data)
+            cached, cache_status = (
+                ai_qa.lookup_cached_answer(request.question, model, member_data, generation)
+                if use_cache else (None, "bypass")
+            )
+            if cached is not None:
+                answer_path_counts["cache"] += 1
+                cached = {**cached, "answer_path": "cache"}
+            else:
+                # Prepare context for AI from the messages relevant to the question
+                context_info = ai_qa.build_question_context(request.question, member_data)
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
+    
+    def done_event(response: Dict[str, Any], cache_status: str) -> str:
+        return format_sse("done", {
+            "answer": response["answer"],
+            "confidence": response["confidence"],
+            "model_used": response["model_used"],
+            "usage": response["usage"],
+            "cache": cache_status,
+            "answer_path": response["answer_path"],
+            "sources_used": response["sources_used"]
+        })
+    
+    async def event_stream():
+        # Local and cached answers are sent whole
+        if cached is not None:
+            yield format_sse("token", {"content": cached["answer"]})
+            yield done_event(cached, cache_status)
+            return
+        
+        try:
+            async for event in ai_qa.stream_ai(request.question, context_info["context"], model):
+                if event["type"] == "token":
+                    yield format_sse("token", {"content": event["content"]})
+                else:
+                    result = {
+                        "answer": event["answer"],
+                        "confidence": event["confidence"],
+                        "usage": event["usage"],
+                        "model_used": event["model_used"],
+                        "attempts": event["attempts"],
+                        "question_type": question_type,
+                        "context_length": len(context_info["context"]),
+                        "context_tokens": context_info["context_tokens"],
+                        "context_strategy": context_info["strategy"],
+                        "messages_included": context_info["messages_included"],
+                        "members_included": context_info["members_included"],
+                        "data_generation": generation,
+                        "sources_used": ["member_data_api", "ai_processing"]
+                    }
+                    ai_qa.store_answer(request.question, model, member_data, generation, result)
+                    answer_path_counts["ai"] += 1
+                    yield done_event({**result, "answer_path": "ai"}, cache_status)
+        except HTTPException as e:
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/members")
-async def get_members():
-    """Get processed member data for verification"""
+async def get_members(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    sort: Literal["name", "message_count", "first_timestamp", "latest_timestamp"] = "name",
+    order: Literal["asc", "desc"] = "asc",
+    search: Optional[str] = None,
+    category: Optional[str] = None,
+    min_messages: int = Query(0, ge=0)
+):
+    """Get processed member data for verification
+    
+    Members can be filtered by name substring, message category and minimum
+    message count, sorted, and paged with offset/limit.
+    """
+    if category is not None and category not in MESSAGE_CATEGORIES:
+        raise HTTPException(status_code=400, detail=f"Unknown category; expected one of: {', '.join(MESSAGE_CATEGORIES)}")
+    
     try:
         member_data = await ai_qa.fetch_member_data()
         
-        # Process the data to show member summary
-        member_summary = {}
-        if isinstance(member_data, dict) and "items" in member_data:
-            items = member_data["items"]
-            total = member_data.get("total", len(items))
-            
-            # Group by member
-            for item in items:
-                if isinstance(item, dict) and "user_name" in item:
-                    user_name = item["user_name"]
-                    if user_name not in member_summary:
-                        member_summary[user_name] = {
-                            "message_count": 0,
-                            "latest_message": "",
-                            "latest_timestamp": ""
-                        }
-                    member_summary[user_name]["message_count"] += 1
-                    
-                    # Keep track of latest message
-                    if item.get("timestamp", "") > member_summary[user_name]["latest_timestamp"]:
-                        member_summary[user_name]["latest_message"] = item.get("message", "")[:100]
-                        member_summary[user_name]["latest_timestamp"] = item.get("timestamp", "")
+        # Summaries are built once per data generation
+        index = ai_qa.get_derived("member_summaries", member_data, MemberSummaryIndex.from_member_data)
+        matches = index.query(search, category, min_messages, sort, descending=order == "desc")
+        page = matches[offset:offset + limit]
         
         return {
             "total_messages": member_data.get("total", 0),
-            "unique_members": len(member_summary),
-            "members": member_summary,
+            "unique_members": len(index.summaries),
+            "matching_members": len(matches),
+            "offset": offset,
+            "limit": limit,
+            "members": {
+                name: {**summary, "categories": dict(summary["categories"])}
+                for name, summary in page
+            },
             "context_preview": ai_qa.prepare_context_for_ai(member_data)[:800] + "..."
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching members: {str(e)}")
 
@@ -360,9 +2745,12 @@ async def get_members():
 async def health_check():
     """Health check endpoint with detailed status"""
     try:
-        # Test external API connectivity
-        async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
-            response = await client.get(f"{API_BASE_URL}/messages")
+        # Test external API connectivity (skipped while its circuit is open)
+        if member_api_breaker.state == "open":
+            api_status = "unhealthy"
+        else:
+            client = ai_qa.get_member_api_client()
+            response = await client.get(f"{API_BASE_URL}/messages", timeout=10.0)
             api_status = "healthy" if response.status_code == 200 else "degraded"
     except:
         api_status = "unhealthy"
@@ -370,12 +2758,32 @@ async def health_check():
     # Test AI service
     ai_status = "configured" if OPENAI_API_KEY else "not_configured"
     
+    cache_age = ai_qa.cache_age_seconds()
+    if not member_data_cache:
+        cache_status = "empty"
+    elif cache_age is not None and cache_age >= CACHE_SOFT_TTL_SECONDS:
+        cache_status = "stale"
+    else:
+        cache_status = "populated"
+    
     return {
         "status": "healthy",
         "api_status": api_status,
         "ai_status": ai_status,
         "ai_model": AI_MODEL,
-        "cache_status": "populated" if member_data_cache else "empty",
+        "cache_status": cache_status,
+        "cache_age_seconds": cache_age,
+        "cache_last_refresh_error": ai_qa.last_refresh_error,
+        "cache_sync": ai_qa.sync_stats(),
+        "answer_cache": answer_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "hedging": hedging_policy.stats(),
+        "answer_paths": dict(answer_path_counts),
+        "circuit_breakers": {
+            "member_api": member_api_breaker.stats(),
+            "llm": llm_breaker.stats()
+        },
         "timestamp": datetime.now().isoformat()
     }
 
@@ -2,15 +2,32 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import httpx
+import asyncio
+import bisect
+import heapq
+import multiprocessing
+import os
 import re
 import json
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Collection, Dict, Iterable, Iterator, List, Any, Optional, Tuple
+from itertools import islice
 from datetime import datetime
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Stop the extraction worker processes on shutdown"""
+    try:
+        yield
+    finally:
+        shutdown_extraction_pool()
+
 app = FastAPI(
     title="Member Data Q&A System",
     description="A question-answering system for member data",
-    version="1.0.1"
+    version="1.0.1",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -37,9 +54,229 @@ cache_last_updated = None
 API_BASE_URL = "https://november7-730026606190.europe-west1.run.app"
 CACHE_DURATION_MINUTES = 10
 
+# Extraction rules as (category, trigger, pattern), compiled once. A pattern can
+# only match a message that contains its trigger phrase, so each message is
+# lowercased once and only the rules whose trigger it contains are run.
+EXTRACTION_RULES = [
+    (category, trigger, re.compile(pattern, re.IGNORECASE))
+    for category, trigger, pattern in [
+        # Travel/location information
+        ("travel", "trip to", r'trip to (\w+)'),
+        ("travel", "travel to", r'travel to (\w+)'),
+        ("travel", "visit", r'visit (\w+)'),
+        ("travel", "going to", r'going to (\w+)'),
+        ("travel", "tickets to", r'tickets to.*in (\w+)'),
+        ("travel", "villa in", r'villa in (\w+)'),
+        ("travel", "tour of", r'tour of .*(\w+)'),
+        ("travel", "weekend in", r'weekend in (\w+)'),
+        # Restaurant information
+        ("restaurant", "dinner", r'dinner.*at ([\w\s]+)'),
+        ("restaurant", "table", r'table.*at ([\w\s]+)'),
+        ("restaurant", "reservation at", r'reservation at ([\w\s]+)'),
+        ("restaurant", "restaurant", r'restaurant ([\w\s]+)'),
+        # Preferences
+        ("preference", "prefer", r'prefer ([\w\s]+)'),
+        ("preference", "preference for", r'preference for ([\w\s]+)'),
+        ("preference", "like", r'I.*like ([\w\s]+)'),
+        ("preference", "ensure", r'ensure ([\w\s]+) next time'),
+        # Activities
+        ("activity", "tickets to", r'tickets to ([\w\s]+)'),
+        ("activity", "passes for", r'passes for ([\w\s]+)'),
+        ("activity", "seats for", r'seats for ([\w\s]+)'),
+        ("activity", "book", r'book.*(\w+\s+\w+).*for'),
+        ("activity", "arrange", r'arrange.*(\w+\s+\w+)'),
+    ]
+]
+RESTAURANT_NAME_NOISE = re.compile(r'\b(for|on|tonight|this|next|the)\b', re.IGNORECASE)
+REQUEST_WORDS = ['book', 'reserve', 'arrange', 'need', 'tickets']
+
+# Question keywords that pick the answer category, matched as whole words so
+# that "seats" does not count as "eat"
+QUESTION_TOPICS = [
+    ("restaurants", re.compile(r"\b(restaurants?|dining|eat(s|ing)?|food|tables?)\b")),
+    ("travel", re.compile(r"\b(trips?|travel\w*|visit\w*|vacations?|where|locations?)\b")),
+    ("preferences", re.compile(r"\b(prefer\w*|likes?|favou?rites?)\b")),
+    ("activities", re.compile(r"\b(activit(y|ies)|tickets?|events?|shows?)\b")),
+    ("vehicles", re.compile(r"\b(cars?|vehicles?|how many)\b")),
+]
+
+# Parallel extraction: payloads with at least EXTRACTION_PARALLEL_MIN_ITEMS
+# messages are sharded by member across EXTRACTION_WORKERS processes (0 = one
+# per CPU); smaller ones are processed on a worker thread
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "0")) or os.cpu_count() or 1
+EXTRACTION_PARALLEL_MIN_ITEMS = int(os.getenv("EXTRACTION_PARALLEL_MIN_ITEMS", "20000"))
+
+class FactSet:
+    """Insertion-ordered set of strings, deduplicated on their casefolded form"""
+    __slots__ = ("_values",)
+    
+    def __init__(self):
+        self._values: Dict[str, str] = {}
+    
+    def add(self, value: str) -> bool:
+        """Add a value unless an equal one (ignoring case) is present; returns whether it was added"""
+        key = value.casefold()
+        if key in self._values:
+            return False
+        self._values[key] = value
+        return True
+    
+    def first(self, count: int) -> List[str]:
+        """The first count values, in insertion order"""
+        return list(islice(self._values.values(), count))
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values.values())
+    
+    def __len__(self) -> int:
+        return len(self._values)
+
+class MemberRecord:
+    """A member's messages and the facts extracted from them"""
+    __slots__ = ("name", "messages", "requests", "preferences", "locations", "activities", "restaurants", "travel")
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.messages: List[Dict[str, str]] = []
+        self.requests: List[str] = []
+        self.preferences = FactSet()
+        self.locations = FactSet()
+        self.activities = FactSet()
+        self.restaurants = FactSet()
+        self.travel: List[str] = []  # One "Trip to ..." entry per new location
+
+# Name particles that do not identify anyone on their own ("Van" in "Amina Van Den Berg")
+NAME_PARTICLES = {"al", "el", "van", "von", "den", "der", "de", "da", "di", "du", "la", "le", "o", "s"}
+
+def name_tokens(text: str) -> List[str]:
+    """Casefolded word tokens; hyphens and apostrophes split names ("Al-Farsi", "Layla's")"""
+    return re.findall(r"\w+", text.casefold())
+
+class MemberNameIndex:
+    """Resolves member mentions in a question in one pass over its tokens
+    
+    Full names are matched with a token trie (longest match wins); the remaining
+    tokens are looked up in a first/last-name part map, weighted by how many
+    members share the part, with prefix matches ("Vik") as a weaker fallback.
+    """
+    
+    def __init__(self, names: Iterable[str]):
+        self.trie: Dict[str, Any] = {}
+        self.parts: Dict[str, List[str]] = {}
+        for name in dict.fromkeys(names):
+            tokens = name_tokens(name)
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = name  # End of a full name
+            for token in set(tokens) - NAME_PARTICLES:
+                if len(token) > 1:
+                    self.parts.setdefault(token, []).append(name)
+        self.sorted_parts = sorted(self.parts)
+    
+    def candidates(self, question: str, partial: bool = True) -> List[Tuple[str, float]]:
+        """(member, score) pairs for the members mentioned in the question, best first"""
+        tokens = name_tokens(question)
+        scores: Dict[str, float] = {}
+        position = 0
+        while position < len(tokens):
+            # Longest full name starting at this token
+            node, end, full_name = self.trie, position, None
+            while end < len(tokens) and tokens[end] in node:
+                node = node[tokens[end]]
+                end += 1
+                if None in node:
+                    full_name, full_end = node[None], end
+            if full_name is not None:
+                scores[full_name] = scores.get(full_name, 0.0) + 10.0
+                position = full_end
+                continue
+            
+            token = tokens[position]
+            members = self.parts.get(token)
+            if members:
+                for member in members:
+                    scores[member] = scores.get(member, 0.0) + 1.0 / len(members)
+            elif partial and len(token) >= 3 and token not in NAME_PARTICLES:
+                # Partial name: parts that start with the token
+                start = bisect.bisect_left(self.sorted_parts, token)
+                matches = []
+                for part in self.sorted_parts[start:]:
+                    if not part.startswith(token):
+                        break
+                    matches.extend(self.parts[part])
+                for member in matches:
+                    scores[member] = scores.get(member, 0.0) + 0.5 / len(matches)
+            position += 1
+        
+        return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))
+    
+    def mentioned(self, question: str) -> frozenset:
+        """Members named in the question by full, first or last name"""
+        return frozenset(member for member, _ in self.candidates(question, partial=False))
+    
+    def resolve(self, question: str) -> Optional[str]:
+        """The single best-matching member, or None if there is none or a tie"""
+        ranked = self.candidates(question)
+        if not ranked or (len(ranked) > 1 and ranked[0][1] == ranked[1][1]):
+            return None
+        return ranked[0][0]
+
+def raw_message_items(raw_data: Any) -> List[Any]:
+    """The message items of an API payload"""
+    # The actual API returns: {"total": 3349, "items": [...]}
+    if isinstance(raw_data, dict) and "items" in raw_data:
+        return raw_data["items"]
+    if isinstance(raw_data, list):
+        return raw_data
+    return []
+
+def shard_by_member(items: List[Any], shard_count: int) -> List[List[Dict[str, Any]]]:
+    """Split valid items into at most shard_count balanced shards, keeping each member's messages together"""
+    by_member: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        if isinstance(item, dict) and "user_name" in item and "message" in item:
+            by_member.setdefault(item["user_name"], []).append(item)
+    
+    # Largest members first, each onto the currently lightest shard
+    shards: List[List[Dict[str, Any]]] = [[] for _ in range(shard_count)]
+    loads = [(0, index) for index in range(shard_count)]
+    for messages in sorted(by_member.values(), key=len, reverse=True):
+        load, index = heapq.heappop(loads)
+        shards[index].extend(messages)
+        heapq.heappush(loads, (load + len(messages), index))
+    return [shard for shard in shards if shard]
+
+def extract_shard(items: List[Dict[str, Any]]) -> Dict[str, MemberRecord]:
+    """Worker process entry point: build the member records for one shard"""
+    return MemberDataAnalyzer().process_member_data(items)
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """The shared extraction process pool, started on first use"""
+    global _extraction_pool
+    if _extraction_pool is None:
+        # Spawned rather than forked: the parent has an event loop and client threads
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _extraction_pool
+
+def shutdown_extraction_pool():
+    """Stop the extraction worker processes (used on shutdown)"""
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(cancel_futures=True)
+        _extraction_pool = None
+
 class MemberDataAnalyzer:
     def __init__(self):
         self.member_data = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Name index for the last processed member data
+        self._name_index: Optional[MemberNameIndex] = None
+        self._name_index_source: Optional[Dict[str, MemberRecord]] = None
     
     async def fetch_member_data(self) -> Dict[str, Any]:
         """Fetch member data from the API with caching"""
@@ -52,14 +289,25 @@ class MemberDataAnalyzer:
             member_data_cache):
             return member_data_cache
         
+        # Coalesce concurrent refreshes: only one download is in flight and
+        # every waiter shares its result (or its error)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_member_data())
+        return await asyncio.shield(self._refresh_task)
+    
+    async def _refresh_member_data(self) -> Dict[str, Any]:
+        """Download member data from the API and update the cache"""
+        global member_data_cache, cache_last_updated
+        
+        now = datetime.now()
         try:
             async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
                 response = await client.get(f"{API_BASE_URL}/messages")
                 response.raise_for_status()
                 data = response.json()
                 
-                # Process the actual data structure
-                processed_data = self.process_member_data(data)
+                # Process the actual data structure without blocking the event loop
+                processed_data = await self.process_member_data_async(data)
                 
                 # Update cache
                 member_data_cache = processed_data
@@ -74,227 +322,186 @@ class MemberDataAnalyzer:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to fetch member data: {str(e)}")
     
-    def process_member_data(self, raw_data: Any) -> Dict[str, Any]:
+    async def process_member_data_async(self, raw_data: Any) -> Dict[str, MemberRecord]:
+        """process_member_data off the event loop, across worker processes for large payloads"""
+        loop = asyncio.get_running_loop()
+        items = raw_message_items(raw_data)
+        if EXTRACTION_WORKERS < 2 or len(items) < EXTRACTION_PARALLEL_MIN_ITEMS:
+            return await loop.run_in_executor(None, self.process_member_data, raw_data)
+        
+        pool = get_extraction_pool()
+        shards = shard_by_member(items, EXTRACTION_WORKERS)
+        results = await asyncio.gather(*(loop.run_in_executor(pool, extract_shard, shard) for shard in shards))
+        
+        # Shards hold disjoint members; restore the order members first appear in
+        merged: Dict[str, MemberRecord] = {}
+        for records in results:
+            merged.update(records)
+        first_seen = dict.fromkeys(
+            item["user_name"] for item in items if isinstance(item, dict) and item.get("user_name") in merged
+        )
+        return {name: merged[name] for name in first_seen}
+    
+    def process_member_data(self, raw_data: Any) -> Dict[str, MemberRecord]:
         """Process the actual API data structure"""
-        members = {}
+        return self.extend_member_data({}, raw_data)
+    
+    def extend_member_data(self, members: Dict[str, MemberRecord], raw_data: Any) -> Dict[str, MemberRecord]:
+        """Add the messages in raw_data to the member records
         
-        # The actual API returns: {"total": 3349, "items": [...]}
-        items = []
-        if isinstance(raw_data, dict) and "items" in raw_data:
-            items = raw_data["items"]
-        elif isinstance(raw_data, list):
-            items = raw_data
+        Returns a new dict; the records of members with new messages are updated in place.
+        """
+        members = dict(members)
         
-        for item in items:
+        for item in raw_message_items(raw_data):
             if isinstance(item, dict) and "user_name" in item and "message" in item:
                 user_name = item["user_name"]
                 message = item["message"]
                 timestamp = item.get("timestamp", "")
                 
-                if user_name not in members:
-                    members[user_name] = {
-                        "name": user_name,
-                        "messages": [],
-                        "requests": [],
-                        "preferences": [],
-                        "locations": [],
-                        "activities": [],
-                        "restaurants": [],
-                        "travel": [],
-                        "other_info": []
-                    }
+                record = members.get(user_name)
+                if record is None:
+                    record = members[user_name] = MemberRecord(user_name)
                 
                 # Store the message
-                members[user_name]["messages"].append({
+                record.messages.append({
                     "message": message,
                     "timestamp": timestamp
                 })
                 
                 # Extract information from the message
-                self.extract_info_from_message(message, members[user_name])
+                self.extract_info_from_message(message, record)
         
         return members
     
-    def extract_info_from_message(self, message: str, member_data: Dict):
+    def extract_info_from_message(self, message: str, record: MemberRecord):
         """Extract structured information from message content"""
         message_lower = message.lower()
         
-        # Extract travel/location information
-        travel_patterns = [
-            r'trip to (\w+)',
-            r'travel to (\w+)', 
-            r'visit (\w+)',
-            r'going to (\w+)',
-            r'tickets to.*in (\w+)',
-            r'villa in (\w+)',
-            r'tour of .*(\w+)',
-            r'weekend in (\w+)'
-        ]
-        
-        for pattern in travel_patterns:
-            matches = re.findall(pattern, message, re.IGNORECASE)
-            for match in matches:
-                if match.lower() not in [loc.lower() for loc in member_data["locations"]]:
-                    member_data["locations"].append(match)
-                    member_data["travel"].append(f"Trip to {match}")
-        
-        # Extract restaurant information
-        restaurant_patterns = [
-            r'dinner.*at ([\w\s]+)',
-            r'table.*at ([\w\s]+)',
-            r'reservation at ([\w\s]+)',
-            r'restaurant ([\w\s]+)'
-        ]
-        
-        for pattern in restaurant_patterns:
-            matches = re.findall(pattern, message, re.IGNORECASE)
-            for match in matches:
-                # Clean up restaurant names
-                restaurant = re.sub(r'\b(for|on|tonight|this|next|the)\b', '', match.strip(), flags=re.IGNORECASE).strip()
-                if len(restaurant) > 3 and restaurant not in member_data["restaurants"]:
-                    member_data["restaurants"].append(restaurant)
-        
-        # Extract preferences
-        preference_patterns = [
-            r'prefer ([\w\s]+)',
-            r'preference for ([\w\s]+)', 
-            r'I.*like ([\w\s]+)',
-            r'ensure ([\w\s]+) next time'
-        ]
-        
-        for pattern in preference_patterns:
-            matches = re.findall(pattern, message, re.IGNORECASE)
-            for match in matches:
-                if len(match.strip()) > 3:
-                    member_data["preferences"].append(match.strip())
-        
-        # Extract activities
-        activity_patterns = [
-            r'tickets to ([\w\s]+)',
-            r'passes for ([\w\s]+)',
-            r'seats for ([\w\s]+)',
-            r'book.*(\w+\s+\w+).*for',
-            r'arrange.*(\w+\s+\w+)'
-        ]
-        
-        for pattern in activity_patterns:
-            matches = re.findall(pattern, message, re.IGNORECASE)
-            for match in matches:
-                activity = match.strip()
-                if len(activity) > 3 and activity not in member_data["activities"]:
-                    member_data["activities"].append(activity)
+        for category, trigger, pattern in EXTRACTION_RULES:
+            if trigger not in message_lower:
+                continue
+            
+            for match in pattern.findall(message):
+                if category == "travel":
+                    if record.locations.add(match):
+                        record.travel.append(f"Trip to {match}")
+                
+                elif category == "restaurant":
+                    # Clean up restaurant names
+                    restaurant = RESTAURANT_NAME_NOISE.sub('', match.strip()).strip()
+                    if len(restaurant) > 3:
+                        record.restaurants.add(restaurant)
+                
+                elif category == "preference":
+                    if len(match.strip()) > 3:
+                        record.preferences.add(match.strip())
+                
+                else:
+                    activity = match.strip()
+                    if len(activity) > 3:
+                        record.activities.add(activity)
         
         # Store general request type
-        if any(word in message_lower for word in ['book', 'reserve', 'arrange', 'need', 'tickets']):
-            member_data["requests"].append(message)
+        if any(word in message_lower for word in REQUEST_WORDS):
+            record.requests.append(message)
     
-    def search_member_data(self, question: str, data: Dict[str, Any]) -> str:
+    def search_member_data(self, question: str, data: Dict[str, MemberRecord]) -> str:
         """Search member data to answer natural language questions"""
+        return self.search_member_data_detailed(question, data)["answer"]
+    
+    def search_member_data_detailed(self, question: str, data: Dict[str, MemberRecord],
+                                    target_name: Optional[str] = None) -> Dict[str, Any]:
+        """Answer a question and report which member, category and facts it used"""
         question_lower = question.lower()
         
-        # Extract the person's name from the question
-        target_name = self.find_member_name(question, data)
+        # Extract the person's name from the question unless the caller resolved it
+        if target_name not in data:
+            target_name = self.find_member_name(question, data)
         
         if not target_name:
             # If no specific member found, provide available members
             available_members = list(data.keys())
             if available_members:
-                return f"I couldn't identify which member you're asking about. Available members: {', '.join(available_members[:10])}{'...' if len(available_members) > 10 else ''}"
-            return "No member data is currently available."
+                answer = f"I couldn't identify which member you're asking about. Available members: {', '.join(available_members[:10])}{'...' if len(available_members) > 10 else ''}"
+            else:
+                answer = "No member data is currently available."
+            return {"answer": answer, "member": None, "category": None, "facts_found": 0, "facts_listed": []}
+        
+        member_info = data[target_name]
         
-        member_info = data.get(target_name, {})
+        def result(answer: str, category: str, facts: Collection[str], listed: Collection[str] = ()) -> Dict[str, Any]:
+            return {"answer": answer, "member": target_name, "category": category,
+                    "facts_found": len(facts), "facts_listed": list(listed)}
         
         # Handle different types of questions
-        if any(word in question_lower for word in ["restaurant", "restaurants", "dining", "eat", "food", "table"]):
-            restaurants = member_info.get("restaurants", [])
+        topic = next((name for name, pattern in QUESTION_TOPICS if pattern.search(question_lower)), None)
+        if topic == "restaurants":
+            restaurants = member_info.restaurants
             if restaurants:
-                return f"{target_name} has made reservations at: {', '.join(restaurants[:5])}."
+                listed = restaurants.first(5)
+                return result(f"{target_name} has made reservations at: {', '.join(listed)}.", "restaurants", restaurants, listed)
             else:
-                return f"I don't have restaurant reservation information for {target_name}."
+                return result(f"I don't have restaurant reservation information for {target_name}.", "restaurants", restaurants)
         
-        elif any(word in question_lower for word in ["trip", "travel", "visit", "vacation", "where", "location"]):
-            locations = member_info.get("locations", [])
-            travel = member_info.get("travel", [])
+        elif topic == "travel":
+            locations = member_info.locations
+            travel = member_info.travel
             if locations:
-                return f"{target_name} has traveled to or mentioned: {', '.join(locations[:5])}."
+                listed = locations.first(5)
+                return result(f"{target_name} has traveled to or mentioned: {', '.join(listed)}.", "travel", locations, listed)
             elif travel:
-                return f"{target_name}'s travel activities: {', '.join(travel[:3])}."
+                return result(f"{target_name}'s travel activities: {', '.join(travel[:3])}.", "travel", travel, travel[:3])
             else:
-                return f"I don't have travel information for {target_name}."
+                return result(f"I don't have travel information for {target_name}.", "travel", [])
         
-        elif any(word in question_lower for word in ["prefer", "preference", "like", "favorite"]):
-            preferences = member_info.get("preferences", [])
+        elif topic == "preferences":
+            preferences = member_info.preferences
             if preferences:
-                return f"{target_name}'s preferences: {', '.join(preferences[:3])}."
+                listed = preferences.first(3)
+                return result(f"{target_name}'s preferences: {', '.join(listed)}.", "preferences", preferences, listed)
             else:
-                return f"I don't have preference information for {target_name}."
+                return result(f"I don't have preference information for {target_name}.", "preferences", preferences)
         
-        elif any(word in question_lower for word in ["activity", "activities", "tickets", "event", "show"]):
-            activities = member_info.get("activities", [])
+        elif topic == "activities":
+            activities = member_info.activities
             if activities:
-                return f"{target_name} has requested tickets/activities for: {', '.join(activities[:3])}."
+                listed = activities.first(3)
+                return result(f"{target_name} has requested tickets/activities for: {', '.join(listed)}.", "activities", activities, listed)
             else:
-                return f"I don't have activity information for {target_name}."
+                return result(f"I don't have activity information for {target_name}.", "activities", activities)
         
-        elif any(word in question_lower for word in ["car", "cars", "vehicle", "how many"]):
+        elif topic == "vehicles":
             # This specific data doesn't seem to contain car ownership info
-            return f"I don't have vehicle ownership information for {target_name} in the current dataset."
+            return result(f"I don't have vehicle ownership information for {target_name} in the current dataset.", "vehicles", [])
         
         else:
             # General information search
             all_info = []
             
-            if member_info.get("restaurants"):
-                all_info.append(f"restaurants: {', '.join(member_info['restaurants'][:2])}")
-            if member_info.get("locations"):
-                all_info.append(f"locations: {', '.join(member_info['locations'][:2])}")
-            if member_info.get("preferences"):
-                all_info.append(f"preferences: {', '.join(member_info['preferences'][:2])}")
+            if member_info.restaurants:
+                all_info.append(f"restaurants: {', '.join(member_info.restaurants.first(2))}")
+            if member_info.locations:
+                all_info.append(f"locations: {', '.join(member_info.locations.first(2))}")
+            if member_info.preferences:
+                all_info.append(f"preferences: {', '.join(member_info.preferences.first(2))}")
             
             if all_info:
-                return f"Here's what I know about {target_name}: {'; '.join(all_info[:3])}."
+                return result(f"Here's what I know about {target_name}: {'; '.join(all_info[:3])}.", "general", all_info, all_info)
             else:
-                message_count = len(member_info.get("messages", []))
-                return f"I have {message_count} messages from {target_name}, but no specific categorized information extracted yet."
+                message_count = len(member_info.messages)
+                return result(f"I have {message_count} messages from {target_name}, but no specific categorized information extracted yet.", "general", [])
     
-    def find_member_name(self, question: str, data: Dict[str, Any]) -> Optional[str]:
+    def find_member_name(self, question: str, data: Dict[str, MemberRecord]) -> Optional[str]:
         """Find the member name mentioned in the question"""
-        question_lower = question.lower()
-        
-        # Enhanced name extraction patterns
-        name_patterns = [
-            r"\b([A-Z][a-z]+ [A-Z][a-z-']+)\b",  # Full name (including hyphenated)
-            r"\b([A-Z][a-z]+)\s+(?:planning|has|have|owns?|likes?|is|'s)\b",
-            r"\b(?:is|does)\s+([A-Z][a-z]+ [A-Z][a-z-']+)\b",
-            r"\b(?:is|does)\s+([A-Z][a-z]+)\b",
-            r"\b([A-Z][a-z]+)'s\b",
-            r"(?:about|of)\s+([A-Z][a-z]+ [A-Z][a-z-']+)",
-            r"(?:about|of)\s+([A-Z][a-z]+)",
-        ]
-        
-        for pattern in name_patterns:
-            match = re.search(pattern, question)
-            if match:
-                potential_name = match.group(1).replace("'s", "")
-                
-                # Exact match first
-                if potential_name in data:
-                    return potential_name
-                
-                # Fuzzy matching
-                for member_name in data.keys():
-                    # Check if first name or last name matches
-                    potential_parts = potential_name.split()
-                    member_parts = member_name.split()
-                    
-                    for p_part in potential_parts:
-                        for m_part in member_parts:
-                            if (p_part.lower() == m_part.lower() or
-                                p_part.lower() in m_part.lower() or
-                                m_part.lower() in p_part.lower()):
-                                return member_name
-        
-        return None
+        return self.get_name_index(data).resolve(question)
+    
+    def get_name_index(self, data: Dict[str, MemberRecord]) -> MemberNameIndex:
+        """The name index for data, rebuilt only when the member data changes"""
+        if self._name_index_source is not data:
+            self._name_index = MemberNameIndex(data.keys())
+            self._name_index_source = data
+        return self._name_index
 
 # Initialize analyzer
 analyzer = MemberDataAnalyzer()
@@ -332,11 +539,11 @@ async def get_members():
         return {
             "count": len(member_data),
             "members": {name: {
-                "message_count": len(info.get("messages", [])),
-                "restaurants": info.get("restaurants", []),
-                "locations": info.get("locations", []),
-                "preferences": info.get("preferences", []),
-                "activities": info.get("activities", [])
+                "message_count": len(info.messages),
+                "restaurants": list(info.restaurants),
+                "locations": list(info.locations),
+                "preferences": list(info.preferences),
+                "activities": list(info.activities)
             } for name, info in member_data.items()}
         }
     except Exception as e:
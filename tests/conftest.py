@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def make_items(count, start=0):
+    return [
+        {
+            "id": f"m{index}",
+            "user_name": ["Hans Müller", "Layla Kawaguchi", "Sophia Al-Farsi"][index % 3],
+            "timestamp": f"2025-01-{index % 28 + 1:02d}T10:00:00",
+            "message": f"Book a table for {index} at Nobu — café “{index}”"
+        }
+        for index in range(start, start + count)
+    ]
+
+
+@pytest.fixture
+def qa(monkeypatch):
+    """A fresh AIQuestionAnswering with an empty member data cache and a closed breaker"""
+    monkeypatch.setattr(main, "member_data_cache", {})
+    monkeypatch.setattr(main, "cache_last_updated", None)
+    monkeypatch.setattr(main, "cache_generation", 0)
+    monkeypatch.setattr(main, "cache_content_hash", None)
+    monkeypatch.setattr(main, "HYBRID_MODE", "ai")
+    monkeypatch.setattr(main, "CACHE_SYNC_MODE", "incremental")
+    monkeypatch.setattr(main, "CACHE_SYNC_PAGE_SIZE", 50)
+    monkeypatch.setattr(main, "member_api_breaker", main.CircuitBreaker(
+        "member_api", main.CIRCUIT_FAILURE_RATE, main.CIRCUIT_MIN_CALLS,
+        main.CIRCUIT_WINDOW_SECONDS, main.CIRCUIT_COOLDOWN_SECONDS
+    ))
+    return main.AIQuestionAnswering()
+
+
+class FakeClock:
+    """Stands in for time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(main.time, "monotonic", clock)
+    return clock
@@ -0,0 +1,45 @@
+from main import CircuitBreaker
+
+
+def make_breaker():
+    return CircuitBreaker("test", failure_rate=0.5, min_calls=4, window_seconds=60, cooldown_seconds=30)
+
+
+def test_breaker_opens_at_failure_rate(clock):
+    breaker = make_breaker()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+    breaker.record_failure()  # 2 of 4 failed
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_breaker_forgets_failures_outside_window(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 61
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_probe(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record_failure()
+
+    clock.now += 30
+    assert breaker.allow()  # The probe
+    assert not breaker.allow()  # Only one at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
@@ -0,0 +1,59 @@
+import pytest
+
+import main
+
+
+def payload(messages):
+    return {
+        "total": len(messages),
+        "items": [
+            {"id": str(index), "user_name": name, "timestamp": f"2025-03-{index % 28 + 1:02d}T10:00:00", "message": message}
+            for index, (name, message) in enumerate(messages)
+        ]
+    }
+
+
+DATA = payload([
+    ("Amina Van Den Berg", "I need a trip to Paris next month."),
+    ("Amina Van Den Berg", "Book a villa in Santorini for the weekend."),
+    ("Hans Müller", "Please book a table for 4 at Nobu on Friday."),
+    ("Hans Müller", "I prefer aisle seats on flights."),
+    ("Vikram Desai", "Could you arrange a tour of the Louvre for 3 guests?"),
+    ("Lily O'Sullivan", "I prefer aisle seats on flights."),
+    ("Lily O'Sullivan", "I prefer vegan meals."),
+    ("Lily O'Sullivan", "I prefer a quiet table by the window."),
+    ("Lily O'Sullivan", "I prefer early check-in."),
+])
+
+
+@pytest.mark.parametrize("question, confidence", [
+    # Clean, complete facts for a fully named member
+    ("Where has Amina Van Den Berg traveled?", 0.9),
+    ("What are Hans Müller's preferences?", 0.9),
+    # Named by first name only
+    ("Where has Amina traveled?", 0.8),
+    # Noise left by the rules: doubled spaces ("Nobu  Friday") and fragments ("s")
+    ("What restaurants has Hans Müller made reservations at?", 0.6),
+    ("Where has Vikram Desai traveled?", 0.6),
+    # More preferences than the answer lists
+    ("What are Lily O'Sullivan's preferences?", 0.6),
+    # Words the category's fact list does not cover
+    ("Does Hans Müller prefer window or aisle seats?", 0.5),
+    # Not a lookup the rules can answer
+    ("When is Amina Van Den Berg traveling?", 0.4),
+    # No member, or nothing categorised
+    ("Where has everyone traveled?", 0.2),
+    ("Tell me about Hans Müller", 0.2),
+])
+def test_answer_locally_confidence(qa, question, confidence):
+    assert qa.answer_locally(question, DATA)["confidence"] == confidence
+
+
+def test_only_confident_local_answers_skip_the_ai(qa, monkeypatch):
+    monkeypatch.setattr(main, "LOCAL_ANSWER_MIN_CONFIDENCE", 0.85)
+    served = qa.try_local_answer("Where has Amina Van Den Berg traveled?", DATA, 1, "auto")
+    assert served["answer_path"] == "local"
+    assert served["model_used"] == "local-rules"
+    assert qa.try_local_answer("Where has Vikram Desai traveled?", DATA, 1, "auto") is None
+    assert qa.try_local_answer("Where has Vikram Desai traveled?", DATA, 1, "local") is not None
+    assert qa.try_local_answer("Where has Amina Van Den Berg traveled?", DATA, 1, "ai") is None
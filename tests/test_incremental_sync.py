@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+from conftest import make_items
+
+
+class FakeMessagesAPI:
+    """Mock /messages endpoint; paging is "ok", "ignored" or an HTTP status to reject it with"""
+
+    def __init__(self, items, paging="ok"):
+        self.items = items
+        self.paging = paging
+        self.calls = []
+
+    def handler(self, request):
+        params = dict(request.url.params)
+        self.calls.append(params)
+        if "skip" in params and self.paging == "ok":
+            skip, limit = int(params["skip"]), int(params["limit"])
+            return httpx.Response(200, json={"total": len(self.items), "items": self.items[skip:skip + limit]})
+        if "skip" in params and self.paging != "ignored":
+            return httpx.Response(self.paging, json={"detail": "rejected"})
+        return httpx.Response(200, json={"total": len(self.items), "items": self.items})
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+def refresh(qa, api):
+    qa.member_api_client = api.client()
+    return asyncio.run(qa._refresh_member_data())
+
+
+def test_incremental_sync_pages_in_new_messages(qa):
+    api = FakeMessagesAPI(make_items(120))
+    refresh(qa, api)
+    api.items = api.items + make_items(70, start=120)
+    api.calls.clear()
+
+    data = refresh(qa, api)
+    assert api.calls == [{"skip": "119", "limit": "50"}, {"skip": "169", "limit": "50"}]
+    assert data["items"] == api.items
+    assert data["total"] == 190
+    assert qa.sync_state["paging_supported"]
+
+
+def test_incremental_sync_extends_indexes(qa):
+    api = FakeMessagesAPI(make_items(60))
+    data = refresh(qa, api)
+    stats = qa.get_derived("message_stats", data, main.MessageStats.from_member_data)
+    api.items = api.items + make_items(3, start=60)
+
+    data = refresh(qa, api)
+    assert qa.get_derived("message_stats", data, main.MessageStats.from_member_data) is stats
+    assert stats.total == 63
+    assert stats.records == main.MessageStats.from_member_data(data).records
+
+
+@pytest.mark.parametrize("status", [400, 404, 422])
+def test_rejected_paging_falls_back_to_full_sync(qa, status):
+    api = FakeMessagesAPI(make_items(60), paging=status)
+    refresh(qa, api)
+    api.items = api.items + make_items(5, start=60)
+    api.calls.clear()
+
+    data = refresh(qa, api)
+    assert api.calls == [{"skip": "59", "limit": "50"}, {}]
+    assert data["items"] == api.items
+    assert not qa.sync_state["paging_supported"]
+
+    api.calls.clear()
+    refresh(qa, api)
+    assert api.calls == [{}]
+
+
+def test_rate_limited_paging_is_not_disabled(qa):
+    api = FakeMessagesAPI(make_items(60), paging=429)
+    refresh(qa, api)
+    api.items = api.items + make_items(5, start=60)
+
+    with pytest.raises(HTTPException):
+        refresh(qa, api)
+    assert qa.sync_state["paging_supported"]
+
+
+def test_ignored_paging_falls_back_to_full_sync(qa):
+    api = FakeMessagesAPI(make_items(60), paging="ignored")
+    refresh(qa, api)
+    api.items = api.items + make_items(5, start=60)
+    api.calls.clear()
+
+    data = refresh(qa, api)
+    assert api.calls == [{"skip": "59", "limit": "50"}, {}]
+    assert data["items"] == api.items
+    assert not qa.sync_state["paging_supported"]
+
+
+def test_shrunk_list_falls_back_to_full_sync(qa):
+    api = FakeMessagesAPI(make_items(60))
+    refresh(qa, api)
+    api.items = api.items[1:]
+    api.calls.clear()
+
+    data = refresh(qa, api)
+    assert api.calls == [{"skip": "59", "limit": "50"}, {}]
+    assert data["items"] == api.items
+    assert qa.sync_state["paging_supported"]
+
+
+def test_unchanged_full_sync_keeps_snapshot(qa, monkeypatch):
+    api = FakeMessagesAPI(make_items(60))
+    data = refresh(qa, api)
+    generation = main.cache_generation
+    monkeypatch.setattr(main, "CACHE_SYNC_MODE", "full")
+    qa.sync_state = None
+
+    assert refresh(qa, api) is data
+    assert main.cache_generation == generation
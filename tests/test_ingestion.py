@@ -0,0 +1,67 @@
+import json
+import random
+
+import pytest
+
+from conftest import make_items
+from main import StreamingItemsParser
+
+
+def parse_in_chunks(body, boundaries):
+    parser = StreamingItemsParser()
+    items, previous = [], 0
+    for boundary in boundaries + [len(body)]:
+        items.extend(parser.feed(body[previous:boundary]))
+        previous = boundary
+    items.extend(parser.feed(b"", final=True))
+    return parser, items
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 20])
+def test_parser_fixed_chunk_sizes(chunk_size):
+    payload = {"total": 3349, "items": make_items(25), "next": None}
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    parser, items = parse_in_chunks(body, list(range(chunk_size, len(body), chunk_size)))
+    assert items == payload["items"]
+    assert parser.fields == {"total": 3349, "next": None}
+    assert not parser.top_level_list
+
+
+def test_parser_random_chunk_boundaries():
+    rng = random.Random(7)
+    payload = {"items": make_items(40), "total": 40}
+    body = json.dumps(payload, ensure_ascii=False, indent=1).encode()
+    for _ in range(50):
+        boundaries = sorted(rng.sample(range(1, len(body)), 20))
+        parser, items = parse_in_chunks(body, boundaries)
+        assert items == payload["items"]
+        assert parser.fields == {"total": 40}
+
+
+def test_parser_number_split_at_chunk_end():
+    parser = StreamingItemsParser()
+    assert parser.feed(b'{"total": 33') == []
+    assert parser.feed(b'49, "items": []}') == []
+    parser.feed(b"", final=True)
+    assert parser.fields == {"total": 3349}
+
+
+def test_parser_bare_list():
+    items = make_items(5)
+    body = json.dumps(items).encode()
+    parser, parsed = parse_in_chunks(body, list(range(3, len(body), 3)))
+    assert parsed == items
+    assert parser.top_level_list
+
+
+def test_parser_truncated_payload():
+    body = json.dumps({"total": 2, "items": make_items(2)}).encode()
+    parser = StreamingItemsParser()
+    parser.feed(body[:-10])
+    with pytest.raises(ValueError):
+        parser.feed(b"", final=True)
+
+
+def test_parser_invalid_payload():
+    with pytest.raises(ValueError):
+        StreamingItemsParser().feed(b'{"total": 1 1}', final=True)
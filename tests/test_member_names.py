@@ -0,0 +1,55 @@
+import pytest
+
+from main1 import MemberNameIndex
+
+NAMES = [
+    "Sophia Al-Farsi", "Amina Van Den Berg", "Hans Müller", "Lily O'Sullivan",
+    "Vikram Desai", "Layla Kawaguchi", "Layla Berg", "Van Den Berg",
+]
+INDEX = MemberNameIndex(NAMES)
+
+
+@pytest.mark.parametrize("question, members", [
+    ("What did Sophia Al-Farsi book?", {"Sophia Al-Farsi"}),
+    # Case, hyphens, apostrophes and possessives
+    ("where is sophia al farsi going?", {"Sophia Al-Farsi"}),
+    ("What is Lily O'Sullivan's phone number?", {"Lily O'Sullivan"}),
+    ("What did HANS MÜLLER ask for?", {"Hans Müller"}),
+    # The longest full name wins over the name it contains
+    ("Where is Amina Van Den Berg travelling?", {"Amina Van Den Berg"}),
+    ("Where is Van Den Berg travelling?", {"Van Den Berg"}),
+    # First or last name only
+    ("Compare Hans and Vikram", {"Hans Müller", "Vikram Desai"}),
+    ("What did Desai request?", {"Vikram Desai"}),
+    # A shared first name mentions every member who has it
+    ("What did Layla ask for?", {"Layla Kawaguchi", "Layla Berg"}),
+    # Particles alone name nobody, and prefixes do not count as mentions
+    ("Who asked for a table at Le Bernardin or Al Forno?", set()),
+    ("What did Vik ask for?", set()),
+])
+def test_mentioned(question, members):
+    assert INDEX.mentioned(question) == frozenset(members)
+
+
+@pytest.mark.parametrize("question, member", [
+    ("What did Sophia Al-Farsi book?", "Sophia Al-Farsi"),
+    ("What did Müller ask for?", "Hans Müller"),
+    # Prefix fallback for a partial name
+    ("What did Vik ask for?", "Vikram Desai"),
+    ("Where is Kawa going?", "Layla Kawaguchi"),
+    # A full name outranks a first name that other members share
+    ("Does Layla Kawaguchi know Layla?", "Layla Kawaguchi"),
+    # Ties and unknown names resolve to nobody
+    ("What did Layla ask for?", None),
+    ("What did Hans and Vikram ask for?", None),
+    ("What did Zoe ask for?", None),
+    ("Who booked the opera?", None),
+])
+def test_resolve(question, member):
+    assert INDEX.resolve(question) == member
+
+
+def test_candidates_rank_full_names_above_parts():
+    ranked = INDEX.candidates("Is Amina Van Den Berg related to Layla?")
+    assert ranked[0] == ("Amina Van Den Berg", 10.0)
+    assert dict(ranked[1:]) == {"Layla Berg": 0.5, "Layla Kawaguchi": 0.5}
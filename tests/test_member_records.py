@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import httpx
+
+import main
+
+
+def make_payload(count):
+    names = ["Hans Müller", "Layla Kawaguchi", "Amina Van Den Berg"]
+    return {
+        "total": count,
+        "items": [
+            {"id": str(index), "user_name": names[index % 3], "timestamp": "2025-03-01T10:00:00",
+             "message": "I need a trip to Paris next month."}
+            for index in range(count)
+        ]
+    }
+
+
+def track_extraction_threads(monkeypatch):
+    threads = []
+    process_member_data = main.rule_analyzer.process_member_data
+
+    def tracked(raw_data):
+        threads.append(threading.current_thread() is threading.main_thread())
+        return process_member_data(raw_data)
+
+    monkeypatch.setattr(main.rule_analyzer, "process_member_data", tracked)
+    return threads
+
+
+def test_full_sync_builds_records_before_publishing(qa, monkeypatch):
+    monkeypatch.setattr(main, "HYBRID_MODE", "auto")
+    on_main_thread = track_extraction_threads(monkeypatch)
+    payload = make_payload(30)
+    qa.member_api_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json=payload))
+    )
+
+    async def refresh_and_ask():
+        data = await qa._full_sync()
+        # Published together with the snapshot, not warmed afterwards
+        assert "member_records" in qa._derived_store(data)
+        return await qa.answer_question("Where has Hans Müller traveled?", member_data=data,
+                                        generation=main.cache_generation, mode="local")
+
+    answer = asyncio.run(refresh_and_ask())
+    assert answer["answer_path"] == "local"
+    assert on_main_thread == [False]
+
+
+def test_missing_records_are_built_once_off_the_loop(qa, monkeypatch):
+    on_main_thread = track_extraction_threads(monkeypatch)
+    data = make_payload(30)
+    monkeypatch.setattr(main, "member_data_cache", data)
+    monkeypatch.setattr(main, "cache_generation", 1)
+
+    async def ask_concurrently():
+        return await asyncio.gather(*(
+            qa.answer_question(question, member_data=data, generation=1, mode="local")
+            for question in ["Where has Hans Müller traveled?", "Where has Layla Kawaguchi traveled?"]
+        ))
+
+    answers = asyncio.run(ask_concurrently())
+    assert [answer["answer_path"] for answer in answers] == ["local", "local"]
+    assert on_main_thread == [False]
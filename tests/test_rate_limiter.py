@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from main import RateLimiter
+
+
+def test_disabled_limiter_never_waits():
+    limiter = RateLimiter(0, 0, max_wait_seconds=0)
+
+    async def acquire_many():
+        for _ in range(1000):
+            await limiter.acquire(10000)
+
+    asyncio.run(acquire_many())
+    assert limiter.try_acquire(10 ** 9)
+    assert limiter.rejected == 0
+
+
+def test_limiter_rejects_past_max_wait():
+    limiter = RateLimiter(2, 0, max_wait_seconds=0.05)
+
+    async def acquire_three():
+        await limiter.acquire(100)
+        await limiter.acquire(100)
+        await limiter.acquire(100)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(acquire_three())
+    assert error.value.status_code == 503
+    assert limiter.rejected == 1
+    assert not limiter.try_acquire(100)
+
+
+def test_token_bucket_refills_and_refunds(clock):
+    limiter = RateLimiter(0, 600, max_wait_seconds=0)
+    assert limiter.try_acquire(600)
+    assert not limiter.try_acquire(100)
+
+    clock.now += 10  # 600 tokens per minute
+    assert limiter.try_acquire(100)
+
+    limiter.record_usage(estimated_tokens=100, usage={"total_tokens": 40})
+    assert limiter.tokens.available == pytest.approx(60)
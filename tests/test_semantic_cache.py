@@ -0,0 +1,63 @@
+import pytest
+
+import main
+from main import HashingEmbedder, SemanticAnswerCache
+
+HANS = frozenset(["Hans Müller"])
+LAYLA = frozenset(["Layla Kawaguchi"])
+ANSWER = {"answer": "Hans booked a trip to Paris.", "confidence": 0.9}
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticAnswerCache(max_entries=4, threshold=0.85, embedder=HashingEmbedder(1024))
+    cache.add("What trips has Hans Müller booked?", "gpt-4o-mini", 1, HANS, ANSWER)
+    return cache
+
+
+def test_paraphrase_hits(cache):
+    hit = cache.lookup("Which trips did Hans Müller plan?", "gpt-4o-mini", 1, HANS)
+    assert hit["answer"] == ANSWER["answer"]
+    assert hit["similarity"] >= 0.85
+    assert cache.hits == 1
+
+
+def test_different_topic_misses(cache):
+    assert cache.lookup("What restaurants has Hans Müller booked?", "gpt-4o-mini", 1, HANS) is None
+
+
+def test_scoped_to_the_same_members(cache):
+    assert cache.lookup("What trips has Layla Kawaguchi booked?", "gpt-4o-mini", 1, LAYLA) is None
+    assert cache.lookup("What trips have Hans Müller and Layla Kawaguchi booked?",
+                        "gpt-4o-mini", 1, HANS | LAYLA) is None
+
+
+def test_scoped_to_the_same_question_words(cache):
+    # "When" and "how many" ask for something else than the cached answer gives
+    assert cache.lookup("When has Hans Müller booked trips?", "gpt-4o-mini", 1, HANS) is None
+    assert cache.lookup("How many trips has Hans Müller booked?", "gpt-4o-mini", 1, HANS) is None
+
+
+def test_scoped_to_model_and_generation(cache):
+    assert cache.lookup("Which trips did Hans Müller plan?", "gpt-4o", 1, HANS) is None
+    assert cache.lookup("Which trips did Hans Müller plan?", "gpt-4o-mini", 2, HANS) is None
+
+
+def test_expired_entries_miss(cache, clock):
+    cache.add("Which villas has Hans Müller booked?", "gpt-4o-mini", 1, HANS, ANSWER)
+    clock.now += main.ANSWER_CACHE_TTL_SECONDS + 1
+    assert cache.lookup("What villas did Hans Müller book?", "gpt-4o-mini", 1, HANS) is None
+
+
+def test_oldest_entry_is_overwritten_when_full(cache):
+    for topic in ["restaurants", "tickets", "cars", "phones"]:
+        cache.add(f"What {topic} has Hans Müller booked?", "gpt-4o-mini", 1, HANS, ANSWER)
+    assert cache.size == 4
+    assert cache.lookup("Which trips did Hans Müller plan?", "gpt-4o-mini", 1, HANS) is None
+    assert cache.lookup("Which tickets did Hans Müller book?", "gpt-4o-mini", 1, HANS) is not None
+
+
+def test_clear(cache):
+    cache.clear()
+    assert cache.size == 0
+    assert cache.lookup("Which trips did Hans Müller plan?", "gpt-4o-mini", 1, HANS) is None
@@ -0,0 +1,86 @@
+import pytest
+
+from main import MessageStats, parse_stats_query
+
+
+def item(member, date, message):
+    return {"user_name": member, "timestamp": f"{date}T10:00:00", "message": message}
+
+
+STATS = MessageStats.from_member_data({"total": 6, "items": [
+    item("Anna Adams", "2025-01-05", "Book a table at Nobu for dinner."),
+    item("Anna Adams", "2025-02-10", "Reserve lunch for two."),
+    item("Anna Adams", "2025-03-15", "I need a trip to Paris."),
+    item("Ben Brown", "2025-02-20", "Dinner for four on Friday."),
+    item("Ben Brown", "2025-03-01", "Book a flight to Rome."),
+    item("Cleo Clark", "2025-03-10", "Get me tickets to the opera."),
+]})
+
+
+@pytest.mark.parametrize("question, mentioned, expected", [
+    ("How many messages has Anna Adams sent?", {"Anna Adams"},
+     {"member": "Anna Adams", "category": None, "start": "", "end": "", "metric": "messages"}),
+    ("How many dinner reservations has Anna made in February 2025?", {"Anna Adams"},
+     {"member": "Anna Adams", "category": "restaurants", "start": "2025-02-01", "end": "2025-02-31", "metric": "messages"}),
+    ("How many messages were sent between 2025-01-01 and 2025-02-28?", set(),
+     {"member": None, "category": None, "start": "2025-01-01", "end": "2025-02-28", "metric": "messages"}),
+    ("How many members have requested a car?", set(),
+     {"member": None, "category": "transport", "start": "", "end": "", "metric": "members"}),
+    ("Top 2 members by travel requests in 2025", set(),
+     {"member": None, "category": "travel", "start": "2025-01-01", "end": "2025-12-31",
+      "metric": "top_members", "top_n": 2, "ascending": False}),
+    ("Who sent the least messages about restaurants?", set(),
+     {"member": None, "category": "restaurants", "start": "", "end": "",
+      "metric": "top_members", "top_n": 1, "ascending": True}),
+])
+def test_parse_stats_query(question, mentioned, expected):
+    assert parse_stats_query(question, frozenset(mentioned)) == expected
+
+
+@pytest.mark.parametrize("question, mentioned", [
+    # Words the filters cannot express go to the AI
+    ("How many messages mention Paris?", set()),
+    ("How many times has Anna Adams been to Paris?", {"Anna Adams"}),
+    ("How many requests for Nobu has Anna made?", {"Anna Adams"}),
+    # Not about the messages, unparseable dates, several categories, lookups
+    ("How many cars does Ben own?", {"Ben Brown"}),
+    ("How many messages did Anna send last month?", {"Anna Adams"}),
+    ("How many dinner and flight requests were there?", set()),
+    ("What did Anna Adams ask for?", {"Anna Adams"}),
+])
+def test_parse_stats_query_declines(question, mentioned):
+    assert parse_stats_query(question, frozenset(mentioned)) is None
+
+
+def ask(question, mentioned=()):
+    return STATS.answer(parse_stats_query(question, frozenset(mentioned)))
+
+
+def test_message_counts():
+    assert ask("How many messages has Anna Adams sent?", {"Anna Adams"}) == "Anna Adams sent 3 messages."
+    assert ask("How many messages about restaurants were sent?") == "Members together sent 3 messages about restaurants."
+    assert ask("How many messages were sent in March 2025?") == \
+        "Members together sent 3 messages between 2025-03-01 and 2025-03-31."
+    assert ask("How many messages since 2025-03-01?") == "Members together sent 3 messages since 2025-03-01."
+
+
+def test_member_counts():
+    assert ask("How many members have booked restaurants?") == "2 members sent messages about restaurants."
+
+
+def test_most_messages():
+    assert ask("Who sent the most messages about restaurants?") == \
+        "Anna Adams sent the most messages about restaurants (2)."
+    assert ask("Top 2 members by messages") == \
+        "Members with the most messages:\n1. Anna Adams: 3\n2. Ben Brown: 2"
+
+
+def test_least_messages_includes_members_without_matches():
+    assert ask("Who sent the least messages about restaurants?") == \
+        "Cleo Clark sent the fewest messages about restaurants (0)."
+    assert ask("Top 3 members with the fewest messages about restaurants") == \
+        "Members with the fewest messages about restaurants:\n1. Cleo Clark: 0\n2. Ben Brown: 1\n3. Anna Adams: 2"
+
+
+def test_no_matching_messages():
+    assert ask("Who sent the least messages about cars?") == "No messages about transport in the data."